@@ -0,0 +1,83 @@
+import asyncio
+import time
+from collections import deque
+
+# Acknowledgements of the messages of one JetStream pull consumer. Fetched messages are received, then consumed once
+# their data is in use, and the consumed ones are acked together once their result has been published: one explicit
+# ack per message (the only ack policy the workqueue RPI stream accepts), sent concurrently. Messages that will not be
+# used are discarded rather than left to be redelivered after the ack wait, when their data would be stale. Counts
+# redeliveries (messages fetched before and never acked in time), discarded messages and the latency from fetch to
+# ack, to size the consumer's ack-wait against.
+
+
+# value at fraction q of the sorted values
+def quantile(values, q):
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+# ack wait (seconds) of a pull subscription's consumer
+async def consumer_ack_wait(sub):
+    info = await sub.consumer_info()
+    return info.config.ack_wait
+
+
+class AckTracker:
+    def __init__(self, name, ack_wait=None, size=1000):
+        self.name = name
+        self.ack_wait = ack_wait
+        self.received = deque()
+        self.consumed = []
+        self.latencies = deque(maxlen=size)
+        self.redelivered = 0
+        self.acked = 0
+        self.discarded = 0
+        self.terminated = 0
+
+    # Messages fetched, in order
+    def receive(self, messages):
+        now = time.monotonic()
+        for message in messages:
+            if message.metadata.num_delivered > 1:
+                self.redelivered += 1
+            self.received.append((message, now))
+
+    # The oldest count received messages are in use, ack them with the next ack()
+    def consume(self, count):
+        for _ in range(count):
+            self.consumed.append(self.received.popleft())
+
+    async def ack(self):
+        if not self.consumed:
+            return
+
+        await asyncio.gather(*(message.ack() for message, _ in self.consumed))
+
+        now = time.monotonic()
+        self.latencies.extend(now - received for _, received in self.consumed)
+        self.acked += len(self.consumed)
+        self.consumed.clear()
+
+    # Give up the received messages that will not be used (e.g. their processing failed): they are acked, and the
+    # poison ones, which would fail again on every redelivery (e.g. a payload that does not parse), are terminated.
+    # Consumed messages are acked as well.
+    async def discard(self, poison=()):
+        poison = {id(message) for message in poison}
+        messages = [message for message, _ in self.received]
+        self.received.clear()
+        self.discarded += len(messages)
+        self.terminated += sum(id(message) in poison for message in messages)
+
+        await asyncio.gather(*(message.term() if id(message) in poison else message.ack() for message in messages))
+        await self.ack()
+
+    def report(self):
+        line = (f"{self.name}: {self.acked} acked, {self.discarded} discarded ({self.terminated} terminated), "
+                f"{self.redelivered} redelivered, {len(self.received) + len(self.consumed)} unacked")
+        if self.latencies:
+            p50, p99 = quantile(self.latencies, 0.5), quantile(self.latencies, 0.99)
+            line += f", ack latency p50 {p50:.2f}s p99 {p99:.2f}s max {max(self.latencies):.2f}s"
+        if self.ack_wait:
+            line += f" (ack wait {self.ack_wait:g}s)"
+
+        return line
@@ -0,0 +1,92 @@
+import glob
+import os
+import sys
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from MLPredictor import FLOAT32_CONTENT_TYPE, decode_features, init_model, to_drop
+
+# Validation of the float32 feature mode (FeatureExtractor's FEATURE_DTYPE=float32): the windows of the recordings
+# are computed by the feature engine in float32 and in float64, the float32 rows go through the feats message path,
+# and the model's input features and predictions of both are compared. float32 math is not just float64 rounded for
+# transport, e.g. the moments of a window lose much of their precision.
+# usage: python Float32Validation.py ['data/processed/*.csv'], run next to model.joblib
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DATA = os.path.join(HERE, 'data', 'processed', '*.csv')
+
+# the feature engine FeatureExtractor runs, and the activity labels of the recordings
+sys.path.insert(0, os.path.join(HERE, '..', 'feature-extractor'))
+sys.path.insert(1, os.path.join(HERE, 'data'))
+from DatasetStore import activity  # noqa: E402
+from SignalFeatures import AXES, WINDOW_LENGTH, feats_batch, feature_names, sliding_frames  # noqa: E402
+
+# windows as served: disjoint WINDOW_LENGTH samples, from the end of the first second of a recording
+START = 100
+
+# relative difference from the float64 value above which a float32 feature counts as off
+TOLERANCE = 1e-3
+
+# stand-in for a NATS message as read by decode_features
+Message = namedtuple('Message', ['data', 'headers'])
+
+
+# float32 feats message of a feature row, as published by FeatureExtractor, decoded by MLPredictor
+def float32_round_trip(row, columns):
+    headers = {'Content-Type': FLOAT32_CONTENT_TYPE, 'Feature-Columns': ','.join(columns)}
+    return decode_features(Message(row.astype('<f4').tobytes(), headers))
+
+
+# float64 and float32 feature rows of the windows of the recordings, and the activity of every window
+def window_features(pattern):
+    blocks64, blocks32, labels = [], [], []
+    for path in sorted(glob.glob(pattern)):
+        signal = pd.read_csv(path)[list(AXES)].to_numpy().T[:, START:]
+        if signal.shape[-1] < WINDOW_LENGTH:
+            continue
+        frames = sliding_frames(signal, WINDOW_LENGTH, WINDOW_LENGTH)
+        blocks64.append(feats_batch(frames, AXES, dtype=np.float64))
+        blocks32.append(feats_batch(frames, AXES, dtype=np.float32))
+        labels += [activity(path)] * len(frames)
+
+    return np.concatenate(blocks64), np.concatenate(blocks32), np.array(labels)
+
+
+def main(pattern=DATA):
+    columns = feature_names(AXES, WINDOW_LENGTH)
+    values64, values32, labels = window_features(pattern)
+
+    # rows with non-finite features are not published by FeatureExtractor
+    finite = np.isfinite(values64).all(axis=1) & np.isfinite(values32).all(axis=1)
+    features64 = pd.DataFrame(values64[finite], columns=columns)
+    features32 = pd.concat([float32_round_trip(row, columns) for row in values32[finite]], ignore_index=True)
+    labels = labels[finite]
+    print(f"Float32 validation on {pattern}: {len(labels)} windows ({np.sum(~finite)} with non-finite features)")
+
+    inputs64 = features64.drop(columns=to_drop, errors='ignore')
+    inputs32 = features32.drop(columns=to_drop, errors='ignore')
+
+    model = init_model()
+    pred64 = model.predict(inputs64.values)
+    pred32 = model.predict(inputs32.values)
+
+    agree = pred64 == pred32
+    print(f"Prediction agreement: {agree.sum()}/{len(agree)} ({agree.mean() * 100:.2f}%)")
+    print(f"Accuracy float64: {(pred64 == labels).mean() * 100:.2f}%, float32: {(pred32 == labels).mean() * 100:.2f}%")
+    for before, after in sorted(set(zip(pred64[~agree], pred32[~agree]))):
+        print(f"  {before} -> {after}: {np.sum((pred64 == before) & (pred32 == after))} rows")
+
+    # relative differences of the model's input features
+    exact = inputs64.to_numpy()
+    difference = np.abs(inputs32.to_numpy(dtype=np.float64) - exact)
+    relative = difference / np.maximum(np.abs(exact), np.finfo(np.float32).tiny)
+    off = relative > TOLERANCE
+    print(f"Windows with an input feature off by more than {TOLERANCE:g}: {off.any(axis=1).mean() * 100:.1f}%")
+    worst = pd.DataFrame({'max relative': relative.max(axis=0), f'windows > {TOLERANCE:g} (%)': off.mean(axis=0) * 100},
+                         index=inputs64.columns).sort_values('max relative', ascending=False)
+    print("Largest relative feature differences:")
+    print(worst.head(10).to_string(float_format=lambda value: f"{value:.3g}"))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
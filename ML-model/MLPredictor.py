@@ -1,11 +1,15 @@
 import ssl
 import asyncio
 import os
+import signal
+import time
 import nats
 import base64
+import numpy as np
 import pandas as pd
 from joblib import load
 from tabpfn import *
+from AckTracker import AckTracker, consumer_ack_wait
 
 # func to load the trained model
 def init_model():
@@ -16,9 +20,28 @@ def init_model():
 TOKEN = os.getenv('NATS_TOKEN')
 NATS_ADDRESS = os.getenv('NATS_ADDRESS')
 
+# seconds between two reports of the ack counters (also on SIGUSR1)
+ACK_REPORT_INTERVAL = float(os.getenv('ACK_REPORT_INTERVAL', 300))
+
 # list of columns to drop when reading incoming features DataFrame
+# (the feature extractor may already leave them out, see its FEATURE_COLUMNS)
 to_drop = ['acc_z_mpf', 'acc_z_iqr', 'acc_x_three_quarters', 'acc_y_three_quarters', 'acc_z_three_quarters', 'acc_y_kurtosis_f', 'acc_z_kurtosis_f', 'acc_y_skewness_f', 'acc_z_skewness_f', 'acc_x_iqr', 'acc_y_iqr', 'acc_y_one_quarter', 'acc_y_wilson_amp', 'acc_z_wilson_amp', 'acc_y_wf', 'acc_y_p2p', 'acc_z_p2p', 'acc_x_wf', 'acc_y_mav', 'acc_z_mav', 'acc_y_stdev', 'acc_x_mad', 'acc_z_wf', 'acc_x_p2p', 'acc_x_kurtosis_f', 'acc_x_skewness_f', 'acc_x_mav', 'acc_y_enwacto_1', 'acc_x_enwacto_1', 'acc_x_autoregyw_2', 'acc_y_autoregyw_1', 'acc_x_autoregburg_1', 'acc_y_autoregburg_1', 'acc_x_autoregburg_2', 'acc_x_autoregburg_3', 'acc_x_autoregburg_4', 'acc_y_autoregburg_2', 'acc_y_autoregburg_3', 'acc_z_autoregyw_3', 'acc_z_autoregburg_2', 'acc_z_autoregburg_3', 'acc_z_autoregburg_4', 'acc_x_mpf', 'acc_x_wilson_amp', 'acc_z_one_quarter', 'acc_x_slope_change', 'acc_y_slope_change', 'acc_z_slope_change', 'acc_x_rms', 'acc_x_mean', 'acc_y_mad', 'acc_y_zerocr', 'acc_y_autoregyw_2', 'acc_y_autoregyw_4', 'acc_z_autoregyw_1']
 
+# content type of feats messages carrying a raw float32 feature row (FeatureExtractor's FEATURE_DTYPE=float32)
+FLOAT32_CONTENT_TYPE = 'application/x-float32'
+
+# reconstruct the features DataFrame of a feats message: a raw little-endian float32 row with the column names in
+# the headers, or a base64-encoded JSON DataFrame
+def decode_features(message):
+    headers = message.headers or {}
+    if headers.get('Content-Type') == FLOAT32_CONTENT_TYPE:
+        values = np.frombuffer(message.data, dtype='<f4')
+        return pd.DataFrame([values], columns=headers['Feature-Columns'].split(','))
+
+    decoded_feats = base64.b64decode(message.data)
+    decoded_feats_str = decoded_feats.decode('utf-8')
+    return pd.read_json(decoded_feats_str, orient='split')
+
 # async communication needed for NATS
 async def main():
     # read ssl files
@@ -36,6 +59,9 @@ async def main():
 
     # create consumer
     sub_feats = await js.pull_subscribe("feats", "RPI-sub-feats", "RPI")
+    tracker = AckTracker("RPI-sub-feats", await consumer_ack_wait(sub_feats))
+    asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, lambda: print(tracker.report()))
+    last_report = time.monotonic()
 
     while True:
         try:
@@ -46,15 +72,20 @@ async def main():
             await asyncio.sleep(2)
             continue 
 
+        tracker.receive(messages)
+        undecodable = []
         try:
             # predict the activity for received features
             for message in messages:
-                # decode from base64, reconstruct DataFrame, and convert to tensor
-                decoded_feats = base64.b64decode(message.data)
-                decoded_feats_str = decoded_feats.decode('utf-8')  
-                featuresDf = pd.read_json(decoded_feats_str, orient='split')
-                featuresDf = featuresDf.drop(columns=to_drop)
+                # reconstruct DataFrame and convert to tensor
+                try:
+                    featuresDf = decode_features(message)
+                except Exception:
+                    undecodable.append(message)
+                    raise
+                featuresDf = featuresDf.drop(columns=to_drop, errors='ignore')
                 if featuresDf.empty == True:
+                    tracker.consume(1)
                     continue
                 window_data = featuresDf.values.reshape(1, -1)
                 
@@ -68,8 +99,21 @@ async def main():
                 # send predicted label to predictions subject
                 _ = await js.publish("predictions", f"{predicted_class}".encode(), stream="RPI")
                 print("prediction sent to NATS")
+                tracker.consume(1)
+
+            # the feature messages are acked once their predictions are published
+            await tracker.ack()
         except Exception as e:
             print(f"Exception ocurred: {e}")
+            # the messages are not retried: those that do not decode are terminated, the others acked
+            try:
+                await tracker.discard(undecodable)
+            except Exception as err:
+                print(f"Discarding failed: {err!r}")
+
+        if time.monotonic() - last_report >= ACK_REPORT_INTERVAL:
+            print(tracker.report())
+            last_report = time.monotonic()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,216 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+# Columnar store of the recorded datasets. The x, y, z recordings of ./processed and the feature csv files of
+# ./features are converted once into two .npy arrays, one row per axis or feature column with the recordings laid
+# end to end, and a manifest.json of where every recording starts, its activity and the hash of its source file.
+# Loaders memory-map the arrays: opening the corpus takes milliseconds, a recording or a window is a zero-copy view,
+# and concurrent readers share the pages of the operating system's file cache instead of each parsing its own copy.
+#
+# usage: python DatasetStore.py build [--store store] | python DatasetStore.py info [--store store]
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+STORE = os.path.join(HERE, 'store')
+PROCESSED = os.path.join(HERE, 'processed', '*.csv')
+# the per-recording feature csv files; merged_features.csv is their concatenation and would store every row twice
+FEATURES = os.path.join(HERE, 'features', '*_processed_features.csv')
+
+AXES = ('x', 'y', 'z')
+MANIFEST = 'manifest.json'
+RECORDINGS = 'recordings.npy'
+FEATURE_VALUES = 'features.npy'
+FEATURE_LABELS = 'feature_labels.npy'
+FORMAT_VERSION = 1
+
+# activity label of a recording, by the start of its file name
+ACTIVITIES = {'walking': 'walking', 'downstairs': 'downstairs', 'upstairs': 'upstairs', 'lying': 'resting',
+              'sitting': 'resting'}
+
+
+def activity(name):
+    name = os.path.basename(name)
+    for prefix, label in ACTIVITIES.items():
+        if name.startswith(prefix):
+            return label
+
+    raise ValueError(f"no activity for recording {name}")
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        digest.update(f.read())
+
+    return digest.hexdigest()
+
+
+# Manifest entries of the source files, in file name order
+def sources(pattern):
+    return [{'name': os.path.splitext(os.path.basename(path))[0], 'path': path, 'sha256': file_hash(path)}
+            for path in sorted(glob.glob(pattern))]
+
+
+# Save an array under a temporary name first so readers never map a partially written file
+def save_array(store, name, array):
+    np.save(os.path.join(store, name + '.tmp.npy'), array)
+    os.replace(os.path.join(store, name + '.tmp.npy'), os.path.join(store, name))
+
+
+# Concatenate the blocks of the entries into one (rows, samples) array, recording start and length of each entry
+def lay_out(entries, blocks):
+    start = 0
+    for entry, block in zip(entries, blocks):
+        entry.update(start=start, length=block.shape[-1])
+        start += block.shape[-1]
+
+    return np.concatenate(blocks, axis=-1) if blocks else np.empty((0, 0))
+
+
+def build_recordings(store, entries):
+    blocks = [pd.read_csv(entry.pop('path'), dtype=np.float64)[list(AXES)].to_numpy().T for entry in entries]
+    for entry in entries:
+        entry['activity'] = activity(entry['name'])
+    save_array(store, RECORDINGS, np.ascontiguousarray(lay_out(entries, blocks)))
+
+    return {'file': RECORDINGS, 'axes': list(AXES), 'entries': entries}
+
+
+# Feature csv files keep their own activity column if they have one, the others are labelled by file name; labels are
+# stored as indices into the manifest's activity list
+def build_features(store, entries):
+    activities = sorted(set(ACTIVITIES.values()))
+    columns = None
+    blocks = []
+    labels = []
+    for entry in entries:
+        frame = pd.read_csv(entry.pop('path'))
+        names = frame['activity'] if 'activity' in frame else [activity(entry['name'])] * len(frame)
+        frame = frame.drop(columns=['activity'], errors='ignore')
+        if columns is None:
+            columns = list(frame.columns)
+        elif list(frame.columns) != columns:
+            raise ValueError(f"columns of {entry['name']} differ from those of {entries[0]['name']}")
+        blocks.append(frame.to_numpy(dtype=np.float64).T)
+        labels.extend(activities.index(name) for name in names)
+
+    save_array(store, FEATURE_VALUES, np.ascontiguousarray(lay_out(entries, blocks)))
+    save_array(store, FEATURE_LABELS, np.array(labels, dtype=np.int8))
+
+    return {'file': FEATURE_VALUES, 'labels': FEATURE_LABELS, 'columns': columns or [], 'activities': activities,
+            'entries': entries}
+
+
+# Convert the csv files into the store; a part whose source files have not changed is kept as it is
+def build(store=STORE, processed=PROCESSED, features=FEATURES):
+    os.makedirs(store, exist_ok=True)
+    manifest = read_manifest(store) or {}
+    if manifest.get('version') != FORMAT_VERSION:
+        manifest = {}
+
+    for part, pattern, builder in (('recordings', processed, build_recordings), ('features', features, build_features)):
+        entries = sources(pattern)
+        stored = manifest.get(part, {}).get('entries', [])
+        if [(e['name'], e['sha256']) for e in entries] != [(e['name'], e['sha256']) for e in stored]:
+            print(f"Converting {len(entries)} {part} files")
+            manifest[part] = builder(store, entries)
+
+    manifest['version'] = FORMAT_VERSION
+    with open(os.path.join(store, MANIFEST + '.tmp'), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(os.path.join(store, MANIFEST + '.tmp'), os.path.join(store, MANIFEST))
+
+    return manifest
+
+
+def read_manifest(store):
+    try:
+        with open(os.path.join(store, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+class DatasetStore:
+    def __init__(self, store=STORE):
+        self.path = store
+        self.manifest = read_manifest(store)
+        if self.manifest is None:
+            raise FileNotFoundError(f"no dataset store in {store}, run: python DatasetStore.py build --store {store}")
+
+        self.recordings = {entry['name']: entry for entry in self.manifest['recordings']['entries']}
+        self.feature_sets = {entry['name']: entry for entry in self.manifest['features']['entries']}
+        self.columns = tuple(self.manifest['features']['columns'])
+        self.activities = tuple(self.manifest['features']['activities'])
+        self._arrays = {}
+
+    # Read-only memory map of a stored array, opened on first use
+    def array(self, name):
+        if name not in self._arrays:
+            self._arrays[name] = np.load(os.path.join(self.path, name), mmap_mode='r')
+        return self._arrays[name]
+
+    # (axes, samples) view of a recording
+    def signal(self, name):
+        entry = self.recordings[name]
+        return self.array(RECORDINGS)[:, entry['start']:entry['start'] + entry['length']]
+
+    # (windows, axes, length) view of the windows of a recording starting every hop samples from start
+    def windows(self, name, length=500, start=100, hop=500):
+        signal = self.signal(name)[:, start:]
+        if signal.shape[-1] < length:
+            return np.empty((0, signal.shape[0], length))
+        return np.lib.stride_tricks.sliding_window_view(signal, length, axis=-1)[:, ::hop].swapaxes(0, 1)
+
+    # (rows, columns) view of the features of a feature csv, or of all of them, and the activity of every row
+    def features(self, name=None):
+        values = self.array(FEATURE_VALUES)
+        labels = self.array(FEATURE_LABELS)
+        if name is not None:
+            entry = self.feature_sets[name]
+            rows = slice(entry['start'], entry['start'] + entry['length'])
+            values, labels = values[:, rows], labels[rows]
+
+        return values.T, np.array(self.activities)[labels]
+
+    # Features as a DataFrame with an activity column, laid out as the feature csv files (this copies the values)
+    def features_df(self, name=None):
+        values, labels = self.features(name)
+        frame = pd.DataFrame(np.array(values), columns=self.columns)
+        frame['activity'] = labels
+
+        return frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Columnar store of the recorded datasets")
+    parser.add_argument('command', choices=['build', 'info'])
+    parser.add_argument('--store', default=STORE, help="store directory")
+    parser.add_argument('--processed', default=PROCESSED, help="glob of the recorded x, y, z csv files")
+    parser.add_argument('--features', default=FEATURES, help="glob of the feature csv files")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        build(args.store, args.processed, args.features)
+        print(f"Store {args.store} up to date in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    store = DatasetStore(args.store)
+    signals = [store.signal(name) for name in store.recordings]
+    values, _ = store.features()
+    elapsed = time.perf_counter() - start
+    print(f"{len(signals)} recordings, {sum(signal.shape[-1] for signal in signals)} samples; "
+          f"{len(store.feature_sets)} feature sets, {values.shape[0]} rows x {values.shape[1]} columns; "
+          f"opened in {elapsed * 1000:.1f}ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
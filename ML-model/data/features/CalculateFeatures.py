@@ -0,0 +1,136 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import numpy as np
+import pandas as pd
+
+# Training features of the recordings in ../processed, computed in parallel and merged into merged_features.csv.
+# Windows are cut as they always were: 1 s (100 samples) is dropped at both ends of a recording and a 501-sample
+# window starts every 500 samples, the last windows being shorter. Rows with missing values (short windows have
+# fewer wavelet levels) or other non-finite features are dropped and every row is labelled with the activity of its
+# file.
+#
+# Features of every recording are cached under the hash of its content, the window parameters and the feature
+# engine's source, so a re-run only computes new or changed recordings. The windows of a recording that is computed
+# go through the engine's FeatureCache with its on-disk tier in the same directory, so windows seen before (e.g. in a
+# recording that was extended or re-cut) are looked up instead of computed again.
+#
+# With --store the recordings are read from a DatasetStore (../DatasetStore.py), which is converted first if needed,
+# instead of parsing the csv files.
+#
+# usage: python CalculateFeatures.py [--data '../processed/*.csv'] [--output merged_features.csv] [--jobs 4]
+#                                    [--store ../store]
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ENGINE = os.path.join(HERE, '..', '..', '..', 'feature-extractor')
+DATA = os.path.join(HERE, '..', 'processed', '*.csv')
+CACHE = os.path.join(HERE, '.feature-cache')
+
+# the serving engine, so training and serving share one implementation (this directory's copy is the reference for
+# tests/performanceTests/featureBenchmark/FeatureParity.py)
+sys.path.insert(0, ENGINE)
+sys.path.insert(1, os.path.join(HERE, '..'))
+from DatasetStore import DatasetStore, activity, build, file_hash  # noqa: E402
+from FeatureCache import FeatureCache, schema_version  # noqa: E402
+from SignalFeatures import AXES, feature_names  # noqa: E402
+
+TRIM = 100
+WINDOW = 501
+HOP = 500
+
+
+def cache_key(content_hash, version):
+    digest = hashlib.sha256(content_hash.encode())
+    digest.update(json.dumps({'trim': TRIM, 'window': WINDOW, 'hop': HOP, 'engine': version}).encode())
+
+    return digest.hexdigest()
+
+
+# (axes, samples) signal of a recording: a csv file, or a recording of the DatasetStore in store
+def load_signal(recording, store=None):
+    if store is not None:
+        return DatasetStore(store).signal(recording)
+    return pd.read_csv(recording)[list(AXES)].to_numpy().T
+
+
+# (windows, columns) feature matrix of a recording laid out as feature_names(AXES, WINDOW); columns a short window
+# does not have are NaN. Window rows are cached in the window_cache directory.
+def recording_features(recording, store=None, window_cache=None):
+    cache = FeatureCache(path=window_cache)
+    signal = load_signal(recording, store)[:, TRIM:-TRIM]
+    columns = feature_names(AXES, WINDOW)
+    starts = range(0, signal.shape[-1], HOP)
+    matrix = np.full((len(starts), len(columns)), np.nan)
+
+    # windows of equal length are computed in one batch
+    lengths = np.array([min(WINDOW, signal.shape[-1] - start) for start in starts])
+    for length in np.unique(lengths):
+        rows = np.flatnonzero(lengths == length)
+        windows = np.stack([signal[:, starts[row]:starts[row] + length] for row in rows])
+        try:
+            values = cache.feats_batch(windows)
+        except Exception as err:
+            # some short tail windows fail (e.g. the frequency vector is one bin too long); as with feats_df in the
+            # notebook, they are dropped
+            print(f"{os.path.basename(recording)}: skipping {len(rows)} window(s) of {length} samples: {err}")
+            continue
+        index = {name: i for i, name in enumerate(feature_names(AXES, length))}
+        keep = [i for i, name in enumerate(columns) if name in index]
+        matrix[np.ix_(rows, keep)] = values[:, [index[columns[i]] for i in keep]]
+
+    return matrix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Training features of the recorded activities")
+    parser.add_argument('--data', default=DATA, help="glob of the recorded x, y, z csv files")
+    parser.add_argument('--output', default=os.path.join(HERE, 'merged_features.csv'), help="merged features csv")
+    parser.add_argument('--cache', default=CACHE, help="directory of the per-recording feature cache")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument('--store', help="read the recordings from this DatasetStore directory")
+    args = parser.parse_args()
+
+    # recordings and the hash of their content, csv paths or names in the store
+    if args.store:
+        manifest = build(args.store, processed=args.data)
+        hashes = {entry['name']: entry['sha256'] for entry in manifest['recordings']['entries']}
+    else:
+        hashes = {path: file_hash(path) for path in sorted(glob.glob(args.data))}
+    paths = list(hashes)
+    if not paths:
+        print(f"No recordings match {args.data}")
+        return 1
+
+    os.makedirs(args.cache, exist_ok=True)
+    version = schema_version()
+    cached = {path: os.path.join(args.cache, cache_key(hashes[path], version) + '.npy') for path in paths}
+    missing = [path for path in paths if not os.path.exists(cached[path])]
+    print(f"{len(paths)} recordings, {len(paths) - len(missing)} cached, computing {len(missing)}")
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        for path, matrix in zip(missing, pool.map(recording_features, missing, repeat(args.store),
+                                                        repeat(os.path.join(args.cache, 'windows')))):
+            # written under a temporary name first so an interrupted run leaves no partial entry
+            np.save(cached[path] + '.tmp.npy', matrix)
+            os.replace(cached[path] + '.tmp.npy', cached[path])
+
+    matrices = [np.load(cached[path]) for path in paths]
+    labels = np.repeat([activity(path) for path in paths], [len(matrix) for matrix in matrices])
+    values = np.concatenate(matrices)
+    merged = pd.DataFrame(values, columns=feature_names(AXES, WINDOW))
+    merged['activity'] = labels
+    merged = merged[np.isfinite(values).all(axis=1)]
+    merged.to_csv(args.output, index=False)
+    print(f"Wrote {len(merged)} rows to {args.output} in {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -572,30 +572,41 @@ def feats_df(data):
         return None
 
 
-def windowing(data, l):
-    curr_df = pd.DataFrame(columns=[*gg])
-    n = len(data)
-
-    # head and tail cut-off seconds
-    head = 0
-    tail = 9
-
-    # select range based on head and tail seconds
-    # adj is used to cut off signal at good point
-    dp = data.iloc[head * 100:n - tail * 100]
-    a = len(dp)
-
-    # window size
-    v = round(l) * 100
-    b = a % v
-
-    dd = pd.DataFrame()
-    for i in range(0, n - tail * 100 - b, v):
-        dd = dp.iloc[i:i + v + 1].reset_index(False)
-        window_feat = feats_df(dd)
-        curr_df = pd.concat([window_feat, curr_df])
-
-    return dd
+# (windows, samples, axes) view of the windows of a (samples, axes) recording: `length` samples starting every `hop`
+# samples, after cutting `head` samples at the start and `tail` at the end. Nothing is copied; the view is writeable
+# like the recording because pywt.wavedec rejects read-only buffers (the features only read their windows).
+def sliding_windows(values, length, hop, head=0, tail=0):
+    values = values[head:len(values) - tail]
+    if len(values) < length:
+        return np.empty((0, length) + values.shape[1:], dtype=values.dtype)
+
+    view = np.lib.stride_tricks.sliding_window_view(values, length, axis=0, writeable=values.flags.writeable)
+    return view[::hop].swapaxes(1, 2)
+
+
+# Features of every window of a recording DataFrame: windows of l seconds (l * fs + 1 samples, as in the training
+# set) every hop seconds (l by default), with head and tail seconds cut off. Windows are views of the recording and
+# their rows are written into a preallocated matrix; windows whose features fail are left out.
+def windowing(data, l, hop=None, head=0, tail=9, fs=100):
+    step = round((l if hop is None else hop) * fs)
+    windows = sliding_windows(data.to_numpy(), round(l * fs) + 1, step, round(head * fs), round(tail * fs))
+
+    matrix = None
+    columns = []
+    computed = np.zeros(len(windows), dtype=bool)
+    for i, window in enumerate(windows):
+        window_feat = feats_df(pd.DataFrame(window, columns=data.columns, copy=False))
+        if window_feat is None:
+            continue
+        if matrix is None:
+            columns = window_feat.columns
+            matrix = np.empty((len(windows), len(columns)))
+        matrix[i] = window_feat.to_numpy()[0]
+        computed[i] = True
+
+    if matrix is None:
+        return pd.DataFrame(columns=columns)
+    return pd.DataFrame(matrix[computed], columns=columns)
 
 
 
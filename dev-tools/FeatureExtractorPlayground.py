@@ -1,9 +1,17 @@
 import asyncio
+import os
+import sys
 import nats
 import pandas as pd
-from SignalFeatures import *
 import base64
 
+# features come from the feature package's engine, through its content-addressed cache: replaying the same recorded
+# windows is a lookup. Set FEATURE_CACHE to a directory to keep the rows across runs.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'feature-extractor'))
+from FeatureCache import FeatureCache
+
+cache = FeatureCache(path=os.getenv('FEATURE_CACHE'))
+
 # async communication needed for NATS
 async def main():
     nc = await nats.connect("nats://haslo@localhost:4222")
@@ -33,7 +41,8 @@ async def main():
     windowDf['y'] = windowDf['y'].astype(float)
     windowDf['z'] = windowDf['z'].astype(float)
 
-    feats = feats_df(windowDf)
+    feats = cache.feats_df(windowDf)
+    print(cache.report())
     json_data = feats.to_json(orient='split')
     base64_encoded_data = base64.b64encode(json_data.encode()).decode()
 
@@ -0,0 +1,63 @@
+import numpy as np
+
+# Auto-regression coefficients of many signals at once. Signals are arrays of shape (..., samples), already
+# mean-removed, and every function reduces over the last axis. The estimates follow statsmodels'
+# regression.yule_walker (method='adjusted') and regression.linear_model.burg, without their per-signal overhead.
+
+
+# Autocovariance of lags 0..order; lag k is divided by n - k (the 'adjusted' estimator), lag 0 by n
+def autocovariance(centered, order=4):
+    n = centered.shape[-1]
+    acov = np.empty(centered.shape[:-1] + (order + 1,), dtype=centered.dtype)
+    acov[..., 0] = np.mean(centered ** 2, axis=-1)
+    for k in range(1, order + 1):
+        acov[..., k] = np.sum(centered[..., :-k] * centered[..., k:], axis=-1) / (n - k)
+
+    return acov
+
+
+# Yule-Walker coefficients from the autocovariance: solves the Toeplitz system R rho = r[1:] of every signal
+def yule_walker(acov):
+    order = acov.shape[-1] - 1
+    lags = np.abs(np.subtract.outer(np.arange(order), np.arange(order)))
+    toeplitz = acov[..., lags]
+    target = acov[..., 1:, None]
+
+    try:
+        return np.linalg.solve(toeplitz, target)[..., 0]
+    except np.linalg.LinAlgError:
+        # a singular system (e.g. a constant signal) falls back to the pseudo-inverse, as statsmodels does
+        return (np.linalg.pinv(toeplitz) @ target)[..., 0]
+
+
+# Partial autocorrelations of lags 1..order from Burg's forward and backward prediction errors
+def burg_pacf(centered, order=4):
+    u = centered[..., ::-1].copy()
+    v = u.copy()
+    pacf = np.zeros(centered.shape[:-1] + (order + 1,), dtype=centered.dtype)
+
+    d = np.sum(u[..., :-1] ** 2, axis=-1) + np.sum(v[..., 1:] ** 2, axis=-1)
+    pacf[..., 1] = 2 / d * np.sum(v[..., 1:] * u[..., :-1], axis=-1)
+    for i in range(1, order):
+        last_u = u.copy()
+        u[..., 1:] = last_u[..., :-1] - pacf[..., i, None] * v[..., 1:]
+        v[..., 1:] = v[..., 1:] - pacf[..., i, None] * last_u[..., :-1]
+        d = (1 - pacf[..., i] ** 2) * d - v[..., i] ** 2 - u[..., -1] ** 2
+        pacf[..., i + 1] = 2 / d * np.sum(v[..., i + 1:] * u[..., i:-1], axis=-1)
+
+    return pacf[..., 1:]
+
+
+# AR coefficients from the partial autocorrelations (Levinson-Durbin recursion)
+def pacf_to_ar(pacf):
+    order = pacf.shape[-1]
+    ar = pacf.copy()
+    for i in range(1, order):
+        prev = ar[..., :i].copy()
+        ar[..., :i] = prev - ar[..., i, None] * prev[..., ::-1]
+
+    return ar
+
+
+def burg(centered, order=4):
+    return pacf_to_ar(burg_pacf(centered, order))
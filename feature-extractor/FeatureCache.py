@@ -0,0 +1,135 @@
+import hashlib
+import os
+from collections import OrderedDict
+from functools import lru_cache
+import numpy as np
+import SignalFeatures
+from SignalFeatures import AXES, backend, check_finite, feats_batch, feature_plan, to_array
+
+# Content-addressed cache of feature rows. A window's key is a hash of its raw bytes, shape and dtype together with
+# the feature schema (engine source, quantile mode, axes and columns), so a row is only reused for the same samples
+# computed by the same code. Rows live in an in-memory LRU tier bounded to `size` rows and, given a directory, in an
+# on-disk tier of one .npy file per row that survives restarts and is shared by processes.
+
+
+ENGINE_SOURCES = ('SignalFeatures.py', 'AutoRegression.py')
+
+
+# Hash of the feature engine's source: any change to the feature code invalidates the cached rows
+@lru_cache(maxsize=None)
+def schema_version():
+    digest = hashlib.sha256()
+    for name in ENGINE_SOURCES:
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), name), 'rb') as f:
+            digest.update(f.read())
+
+    return digest.hexdigest()
+
+
+class FeatureCache:
+    def __init__(self, size=50000, path=None, axes=AXES, columns=None, dtype=np.float64):
+        self.size = size
+        self.path = path
+        self.axes = tuple(axes)
+        self.columns = None if columns is None else frozenset(columns)
+        self.dtype = dtype
+        self.layout = f"{self.axes}:{sorted(self.columns or ())}"
+
+        self.rows = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if path:
+            os.makedirs(path, exist_ok=True)
+
+    # Schema of the rows computed now; the quantile mode is read at key time, as it can be switched at runtime and
+    # changes iqr, one_quarter, three_quarters and median_frequency
+    def schema(self):
+        return f"{schema_version()}:{SignalFeatures.QUANTILE_COMPAT}:{self.layout}".encode()
+
+    def key(self, window):
+        digest = hashlib.blake2b(self.schema(), digest_size=20)
+        digest.update(f"{window.shape}:{window.dtype}".encode())
+        digest.update(np.ascontiguousarray(window).data)
+
+        return digest.hexdigest()
+
+    def file(self, key):
+        return os.path.join(self.path, key[:2], key + '.npy')
+
+    # Cached row of a key or None, looked up in memory first, then on disk
+    def get(self, key):
+        row = self.rows.get(key)
+        if row is not None:
+            self.rows.move_to_end(key)
+            self.hits += 1
+            return row
+
+        if self.path and os.path.exists(self.file(key)):
+            row = np.load(self.file(key))
+            self.disk_hits += 1
+            self.remember(key, row)
+            return row
+
+        self.misses += 1
+        return None
+
+    # Keep a row in memory, dropping the least recently used ones over the size bound
+    def remember(self, key, row):
+        self.rows[key] = row
+        self.rows.move_to_end(key)
+        while len(self.rows) > self.size:
+            self.rows.popitem(last=False)
+
+    def put(self, key, row):
+        self.remember(key, row)
+        if self.path:
+            # written under a temporary name first so concurrent readers never load a partial row
+            file = self.file(key)
+            os.makedirs(os.path.dirname(file), exist_ok=True)
+            np.save(f"{file}.{os.getpid()}.tmp.npy", row)
+            os.replace(f"{file}.{os.getpid()}.tmp.npy", file)
+
+    # feats_batch through the cache: (windows, axes, samples) to the (windows, columns) matrix, the missing rows
+    # computed in one batch
+    def feats_batch(self, windows):
+        windows = to_array(windows, self.dtype)
+        plan = feature_plan(self.columns, self.axes, windows.shape[-1])
+        matrix = np.empty((len(windows), len(plan.columns)), dtype=self.dtype)
+
+        keys = [self.key(window) for window in windows]
+        missing = []
+        for i, key in enumerate(keys):
+            row = self.get(key)
+            if row is None:
+                missing.append(i)
+            else:
+                matrix[i] = row
+
+        if missing:
+            matrix[missing] = feats_batch(windows[missing], self.axes, self.columns, self.dtype)
+            for i in missing:
+                self.put(keys[i], matrix[i].copy())
+
+        return matrix
+
+    # Features of one (axes, samples) window as a flat row, as feats_row
+    def feats_row(self, window):
+        return self.feats_batch(to_array(window, self.dtype)[None])[0]
+
+    # Features of a window DataFrame as a one-row DataFrame, None if they cannot be computed, as feats_df
+    def feats_df(self, data):
+        try:
+            row = self.feats_row(data)
+            plan = feature_plan(self.columns, self.axes, len(data))
+            return backend('pandas').DataFrame(check_finite(row, plan.columns)[None], columns=plan.columns)
+        except Exception as err:
+            print("=====")
+            print(err)
+            print("=====")
+            return None
+
+    def report(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return (f"feature cache: {lookups} lookups, {self.hits} memory hits, {self.disk_hits} disk hits, "
+                f"{self.misses} misses, {len(self.rows)}/{self.size} rows in memory")
@@ -1,19 +1,107 @@
 import asyncio
 import nats
-import pandas as pd
+import numpy as np
 import base64
 import ssl
 import os
-import time
+import signal
 from SignalFeatures import *
+from StreamingFeatures import AxisBuffers, StreamingFeatures
+from AckTracker import AckTracker, consumer_ack_wait
+from FeatureProfile import PhaseTimer, StageProfile
 
 # read env variables needed to connect to NATS
 TOKEN = os.getenv('NATS_TOKEN')
 NATS_ADDRESS = os.getenv('NATS_ADDRESS')
 WINDOW_LENGTH=500
 
+# optional file with the feature columns the model uses, one per line; all features are computed if unset
+FEATURE_COLUMNS = os.getenv('FEATURE_COLUMNS')
+
+# samples between two feature rows; a row always covers the last WINDOW_LENGTH samples
+HOP_LENGTH = int(os.getenv('HOP_LENGTH', WINDOW_LENGTH))
+
+# seconds a fetch waits for messages of an axis; a fetch returns what has arrived by then
+FETCH_TIMEOUT = float(os.getenv('FETCH_TIMEOUT', 5))
+
+# float type of the feature math and of the published features: float64 rows are sent as base64-encoded JSON
+# DataFrames, float32 rows as raw little-endian float32 values with the column names in the message headers
+FEATURE_DTYPE = np.dtype(os.getenv('FEATURE_DTYPE', 'float64'))
+FLOAT32_CONTENT_TYPE = 'application/x-float32'
+
+# per-stage profiling of the feature engine (FEATURE_PROFILE=1): rolling timing histograms of every feature stage,
+# printed every FEATURE_PROFILE_INTERVAL seconds and on SIGUSR1
+FEATURE_PROFILE = os.getenv('FEATURE_PROFILE') == '1'
+FEATURE_PROFILE_INTERVAL = float(os.getenv('FEATURE_PROFILE_INTERVAL', 300))
+
+# seconds between two reports of the time spent fetching, decoding, computing, publishing and acking, and of the ack
+# counters of the consumers (also on SIGUSR1)
+TIMING_INTERVAL = float(os.getenv('TIMING_INTERVAL', 300))
+
+
+# whether the payload of a message is a sample value
+def is_sample(message):
+    try:
+        float(message.data)
+    except ValueError:
+        return False
+
+    return True
+
+
+# pull up to count messages of an axis, fewer if not enough arrive within FETCH_TIMEOUT
+async def pull(sub, count):
+    if count == 0:
+        return []
+    try:
+        return await sub.fetch(count, timeout=FETCH_TIMEOUT)
+    except asyncio.TimeoutError:
+        # nothing new on this axis (nats' TimeoutError is an asyncio.TimeoutError)
+        return []
+
+
+# read the feature column set, lines starting with # are comments
+def load_feature_columns(path):
+    if not path:
+        return None
+
+    with open(path) as f:
+        columns = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+    # fail at startup rather than on the first window if a column is unknown
+    feature_plan(frozenset(columns), AXES, WINDOW_LENGTH)
+    return columns
+
+
 # async communication needed for NATS
 async def main():
+    columns = load_feature_columns(FEATURE_COLUMNS)
+    plan = feature_plan(None if columns is None else frozenset(columns), AXES, WINDOW_LENGTH)
+    print(f"Computing {len(plan.columns)} {FEATURE_DTYPE} feature columns every {HOP_LENGTH} samples")
+    profile = StageProfile() if FEATURE_PROFILE else None
+    stream = StreamingFeatures(AXES, WINDOW_LENGTH, HOP_LENGTH, columns, dtype=FEATURE_DTYPE.type, hook=profile)
+    timer = PhaseTimer()
+
+    trackers = []
+
+    # dump the timings, the ack counters and the profile on request: docker kill --signal=SIGUSR1 feature-extractor
+    def report_timings():
+        print(f"Loop timings:\n{timer.report()}")
+        print("Acks:\n" + "\n".join(tracker.report() for tracker in trackers))
+
+    def report():
+        report_timings()
+        if profile:
+            print(f"Feature profile:\n{profile.report()}")
+
+    asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, report)
+
+    # backends are imported by the first window that needs them, report their cost then; float64 rows are published
+    # as DataFrames, which loads pandas
+    backends = plan.backends if FEATURE_DTYPE == np.float32 else plan.backends + ('pandas',)
+    print(f"Feature backends:\n{import_report(backends)}")
+    backends_reported = False
+
     # read ssl files
     ssl_ctx = ssl.create_default_context(purpose=ssl.Purpose.SERVER_AUTH)
     ssl_ctx.load_verify_locations('./CA.pem')
@@ -29,68 +117,110 @@ async def main():
     sub_x = await js.pull_subscribe("x", "RPI-sub-x", "RPI")
     sub_y = await js.pull_subscribe("y", "RPI-sub-y", "RPI")
     sub_z = await js.pull_subscribe("z", "RPI-sub-z", "RPI")
+    subs = (sub_x, sub_y, sub_z)
 
-    # consume data in 500-data-points tranches
+    for axis, sub in zip(AXES, subs):
+        ack_wait = await consumer_ack_wait(sub)
+        trackers.append(AckTracker(f"RPI-sub-{axis}", ack_wait))
+        print(f"Consumer RPI-sub-{axis}: ack wait {ack_wait:g}s")
+
+    # samples pulled but not yet pushed to the stream, kept per axis until all three axes have them
+    pending = AxisBuffers(len(AXES), HOP_LENGTH, dtype=FEATURE_DTYPE)
+    idle = False
+
+    # consume data in tranches of up to HOP_LENGTH data points per axis
     while True:
-        windowDf = pd.DataFrame(columns=['x', 'y', 'z'])
-        try:
-            x_data = await asyncio.wait_for(sub_x.fetch(WINDOW_LENGTH), timeout=300.0)
-            y_data = await asyncio.wait_for(sub_y.fetch(WINDOW_LENGTH), timeout=300.0)
-            z_data = await asyncio.wait_for(sub_z.fetch(WINDOW_LENGTH), timeout=300.0)
-        except asyncio.TimeoutError:
-            print("No new messages, sleeping for 30 seconds.")
-            await asyncio.sleep(30)
+        # the three axes are pulled concurrently, each topped up to a full tranche; short fetches are kept
+        with timer.phase('fetch'):
+            batches = await asyncio.gather(*(pull(sub, pending.room(axis)) for axis, sub in enumerate(subs)))
+
+        if not any(batches):
+            if not idle:
+                print("No new messages, waiting.")
+            idle = True
             continue
-        
-        try:
-            x_data_list = [m.data.decode() for m in x_data]
-            y_data_list = [m.data.decode() for m in y_data]
-            z_data_list = [m.data.decode() for m in z_data]
+        idle = False
 
-            if (len(x_data_list) != WINDOW_LENGTH) or (len(y_data_list) != WINDOW_LENGTH) or (len(z_data_list) != WINDOW_LENGTH):
-                time.sleep(30)
+        try:
+            # payloads are parsed first and only go to the ring buffers if all three axes parse, so the buffered
+            # samples always match the received messages that are not discarded
+            with timer.phase('decode'):
+                for tracker, batch in zip(trackers, batches):
+                    tracker.receive(batch)
+                values = [np.fromiter((float(m.data) for m in batch), FEATURE_DTYPE, len(batch)) for batch in batches]
+                for axis, axis_values in enumerate(values):
+                    pending.add(axis, axis_values)
+            if not pending.ready():
                 continue
+            samples = pending.take()
+            for tracker in trackers:
+                tracker.consume(samples.shape[-1])
 
             print("=======\nDecoded data")
-            print(x_data_list)
-            print(y_data_list)
-            print(z_data_list)
-
-            # export data from sensors to pandas DataFrame
-            windowDf['x'] = x_data_list
-            windowDf['y'] = y_data_list
-            windowDf['z'] = z_data_list
-
-            print("=======\Constructed dataframe")
-            print(windowDf.head())
-
-            # treat data points as floats
-            windowDf['x'] = windowDf['x'].astype(float)
-            windowDf['y'] = windowDf['y'].astype(float)
-            windowDf['z'] = windowDf['z'].astype(float)
-
-            print("=======\nDataframe as float")
-            print(windowDf.head())
-
-            # calculate features of the given window
-            # send them to feats subject
-            print("=======\nFeatures dataframe")
-            feats = feats_df(windowDf)
-            print(feats)
-
-            print("=======\nDataframe as JSON")
-            json_data = feats.to_json(orient='split')
-            print(json_data)
-
-            print("=======\nBase64 JSON dataframe")
-            base64_encoded_data = base64.b64encode(json_data.encode()).decode()
-            print(base64_encoded_data)
-
-            _ = await js.publish("feats", f"{base64_encoded_data}".encode(), stream="RPI")
-            print("Features published to NATS")
-        
+            print(samples)
+
+            # add the data points all axes have to the sliding window, a feature row is ready every HOP_LENGTH points
+            # once the first WINDOW_LENGTH points have arrived
+            with timer.phase('compute'):
+                rows = stream.push(samples)
+
+            for row in rows:
+                # windows whose features are not all finite (e.g. a constant axis) are not published
+                if not np.isfinite(row).all():
+                    print("=======\nSkipping a window with non-finite features")
+                    continue
+
+                # send the features of the window to feats subject
+                if FEATURE_DTYPE == np.float32:
+                    print("=======\nFeatures")
+                    print(row)
+
+                    payload = row.astype('<f4').tobytes()
+                    headers = {'Content-Type': FLOAT32_CONTENT_TYPE, 'Feature-Columns': ','.join(stream.columns)}
+                else:
+                    print("=======\nFeatures dataframe")
+                    feats = backend('pandas').DataFrame(row[None], columns=stream.columns)
+                    print(feats)
+
+                    print("=======\nDataframe as JSON")
+                    json_data = feats.to_json(orient='split')
+                    print(json_data)
+
+                    print("=======\nBase64 JSON dataframe")
+                    base64_encoded_data = base64.b64encode(json_data.encode()).decode()
+                    print(base64_encoded_data)
+
+                    payload = f"{base64_encoded_data}".encode()
+                    headers = None
+
+                with timer.phase('publish'):
+                    _ = await js.publish("feats", payload, stream="RPI", headers=headers)
+                print("Features published to NATS")
+
+                if not backends_reported:
+                    print(f"Feature backends:\n{import_report(backends)}")
+                    backends_reported = True
+
+            # the samples of the published windows are acked together
+            if len(rows):
+                with timer.phase('ack'):
+                    await asyncio.gather(*(tracker.ack() for tracker in trackers))
+
+            if profile and profile.due(FEATURE_PROFILE_INTERVAL):
+                print(f"Feature profile:\n{profile.report()}")
+            if timer.due(TIMING_INTERVAL):
+                report_timings()
+
         except Exception as e:
-            continue
+            # the samples not yet in the window are dropped and their messages acked: redelivered after the ack wait
+            # they would end up in a later window. Payloads that are not a sample are terminated.
+            print(f"Discarding the fetched samples: {e!r}")
+            pending.clear()
+            try:
+                await asyncio.gather(*(tracker.discard([m for m in batch if not is_sample(m)])
+                                       for tracker, batch in zip(trackers, batches)))
+            except Exception as err:
+                print(f"Discarding failed: {err!r}")
 
 if __name__ == '__main__':
     asyncio.run(main())
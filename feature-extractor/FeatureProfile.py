@@ -0,0 +1,77 @@
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+import numpy as np
+
+# Rolling per-stage profile of the feature engine, used as the hook of feats_df / feats_batch / StreamingFeatures.
+# Keeps the wall times of the last `size` runs and the last output shape of every stage; report() renders them as
+# percentiles and histograms. PhaseTimer counts the time the service loop spends in each of its phases.
+
+
+# histogram bucket edges, 10 us to 1 s, log spaced
+BUCKETS = np.logspace(-5, 0, 11)
+
+
+class StageProfile:
+    def __init__(self, size=1000):
+        self.times = defaultdict(lambda: deque(maxlen=size))
+        self.shapes = {}
+        self.last_report = time.monotonic()
+
+    # the hook: called by run_plan after every stage
+    def __call__(self, stage, seconds, shape):
+        self.times[stage].append(seconds)
+        self.shapes[stage] = shape
+
+    # True once interval seconds have passed since the last report
+    def due(self, interval):
+        return time.monotonic() - self.last_report >= interval
+
+    def report(self):
+        edges = ' '.join(f"{edge * 1e6:g}" for edge in BUCKETS[1:-1])
+        lines = [f"{'stage':<18}{'runs':>6}{'p50 us':>10}{'p99 us':>10}{'max us':>10}  {'shape':<12}"
+                 f"histogram (us edges: {edges})"]
+        for stage, times in self.times.items():
+            times = np.array(times)
+            counts, _ = np.histogram(np.clip(times, BUCKETS[0], BUCKETS[-1]), BUCKETS)
+            p50, p99 = np.percentile(times, [50, 99]) * 1e6
+            lines.append(f"{stage:<18}{len(times):>6}{p50:>10.1f}{p99:>10.1f}{times.max() * 1e6:>10.1f}  "
+                         f"{str(self.shapes[stage]):<12}{' '.join(map(str, counts))}")
+
+        self.last_report = time.monotonic()
+        return '\n'.join(lines)
+
+
+# Wall time spent in the phases of the service loop (fetch, decode, compute, publish) since the last report, and the
+# share of the elapsed time each takes, e.g. how much of every window is spent blocked on the broker
+class PhaseTimer:
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.last_report = time.monotonic()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.totals[name] += time.perf_counter() - start
+            self.counts[name] += 1
+
+    # True once interval seconds have passed since the last report
+    def due(self, interval):
+        return time.monotonic() - self.last_report >= interval
+
+    # One line per phase; the counters start over after every report
+    def report(self):
+        elapsed = time.monotonic() - self.last_report
+        lines = [f"{'phase':<10}{'calls':>8}{'total s':>10}{'mean ms':>10}{'share':>8}   (of {elapsed:.1f} s)"]
+        for name, total in self.totals.items():
+            lines.append(f"{name:<10}{self.counts[name]:>8}{total:>10.2f}{total / self.counts[name] * 1000:>10.1f}"
+                         f"{total / max(elapsed, 1e-9) * 100:>7.1f}%")
+
+        self.totals.clear()
+        self.counts.clear()
+        self.last_report = time.monotonic()
+        return '\n'.join(lines)
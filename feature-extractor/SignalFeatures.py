@@ -1,572 +1,1025 @@
 import numpy as np
-import math
-import pandas as pd
-from scipy import signal
+import importlib
+import time
 import warnings
-import pywt
-import statsmodels.api as sm
-from antropy import spectral_entropy
+from collections import namedtuple
+from functools import lru_cache
+import AutoRegression
 
 warnings.filterwarnings('ignore')
 
-global gg
-gg = []
+# default window layout of the RPI stream
+AXES = ('x', 'y', 'z')
+WINDOW_LENGTH = 500
 
+# spectral quantiles (quartile and median frequencies) as in the training set; False switches to the exact quantiles
+QUANTILE_COMPAT = True
+
+# Float types of the feature math. float64 by default; float32 halves the memory of the windows and intermediates
+# and is enough for a 16-bit accelerometer. The entry points take one of them as dtype.
+FLOAT_DTYPES = (np.float64, np.float32)
+
+
+# ----------------------------------------------------- backends ----------------------------------------------------- #
+# Heavy optional backends (pywt for the wavelet energies, pandas for DataFrame output) are imported on first use,
+# so importing this module only costs NumPy and a restart whose features need nothing else is ready at once.
+# IMPORT_TIMES holds the import time in seconds of every backend loaded so far.
+
+
+BACKENDS = {}
+IMPORT_TIMES = {}
+
+
+def backend(name):
+    module = BACKENDS.get(name)
+    if module is None:
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        IMPORT_TIMES[name] = time.perf_counter() - start
+        BACKENDS[name] = module
+
+    return module
+
+
+# Import the given backends now, e.g. the backends of a feature plan
+def load_backends(names):
+    for name in names:
+        backend(name)
+
+
+# One line per backend with its import cost, or 'deferred' if it has not been needed yet
+def import_report(names=()):
+    lines = [f"{name}: {IMPORT_TIMES[name] * 1000:.0f} ms" for name in IMPORT_TIMES]
+    lines += [f"{name}: deferred" for name in names if name not in IMPORT_TIMES]
+
+    return "\n".join(lines)
 
 
 def fft_sig(sig, fs=100):
     n = len(sig)
-    frequency_vector = np.arange(0, fs, fs / n)
-    com_fft = np.abs(np.fft.fft(sig)) / n
-    com_fft[1:int(np.ceil(n / 2) + 1)] = com_fft[1:int(np.ceil(n / 2) + 1)] * 2
-    com_fft[int(np.ceil(n / 2) + 1):].fill(0)
+    frequency_vector = fft_frequencies(n, fs)
+    com_fft = one_sided_spectrum(np.fft.rfft(sig), n)
 
     return frequency_vector, com_fft
 
 
+# Frequency vector of an n-point FFT, shared by every window of the same length
+@lru_cache(maxsize=None)
+def fft_frequencies(n, fs=100):
+    frequency_vector = np.arange(0, fs, fs / n)
+    frequency_vector.setflags(write=False)
+
+    return frequency_vector
+
+
+# Full-length magnitude spectrum as returned by fft_sig, built from the rfft bins:
+# scaled by 1/n, bins 1..ceil(n/2) doubled, mirrored half zeroed
+def one_sided_spectrum(rfft_values, n):
+    half = int(np.ceil(n / 2))
+    magnitude = np.abs(rfft_values) / n
+    spectrum = np.zeros(magnitude.shape[:-1] + (n,), dtype=magnitude.dtype)
+    spectrum[..., :magnitude.shape[-1]] = magnitude
+
+    # for odd n the last kept bin is the mirror of the last rfft bin
+    if n % 2 and n > 1:
+        spectrum[..., half] = magnitude[..., -1]
+    spectrum[..., 1:half + 1] *= 2
+
+    return spectrum
+
+
+# ---------------------------------------------------- intermediates ------------------------------------------------- #
+# Values shared between features, each declared with the intermediates it is computed from. WindowContext resolves
+# this graph lazily: every intermediate is computed at most once per window (or batch) and only if a feature needs it.
+# 'arr' (the (..., axes, samples) array), 'n' (samples) and 'fs' (sampling rate) are the roots.
+
+
+INTERMEDIATES = {}
+
+
+def intermediate(name, *needs):
+    def register(func):
+        INTERMEDIATES[name] = (func, needs)
+        return func
+
+    return register
+
+
+class WindowContext:
+    def __init__(self, data, fs=100, dtype=np.float64):
+        self.arr = to_array(data, dtype)
+        self.n = self.arr.shape[-1]
+        self.fs = fs
+        self.values = {'arr': self.arr, 'n': self.n, 'fs': fs}
+
+    def __getitem__(self, name):
+        if name not in self.values:
+            func, needs = INTERMEDIATES[name]
+            self.values[name] = func(*(self[need] for need in needs))
+
+        return self.values[name]
+
+    # intermediates are also readable as attributes, e.g. ctx.spectrum
+    def __getattr__(self, name):
+        if name in INTERMEDIATES:
+            return self[name]
+        raise AttributeError(name)
+
+    # axes (an index array) runs a per-axis feature on those axes only, see Feature.axis_needs
+    def run(self, feature, axes=None):
+        if axes is None:
+            return feature.func(*(self[need] for need in feature.needs))
+        return feature.func(*(self[need][..., axes, :] if need in feature.axis_needs else self[need]
+                              for need in feature.needs))
+
+
+# Intermediates needed by a set of features, dependencies first
+def intermediate_order(features):
+    order = []
+
+    def visit(name):
+        if name in INTERMEDIATES and name not in order:
+            for need in INTERMEDIATES[name][1]:
+                visit(need)
+            order.append(name)
+
+    for feature in features:
+        for need in feature.needs:
+            visit(need)
+
+    return tuple(order)
+
+
+intermediate('freqs', 'n', 'fs')(fft_frequencies)
+intermediate('spectrum', 'rfft', 'n')(one_sided_spectrum)
+
+
+@intermediate('mean', 'arr')
+def mean_np(arr):
+    return np.mean(arr, axis=-1)
+
+
+@intermediate('centered', 'arr', 'mean')
+def centered_np(arr, mean):
+    return arr - mean[..., None]
+
+
+# population variance
+@intermediate('variance', 'centered')
+def variance_np(centered):
+    return np.mean(centered ** 2, axis=-1)
+
+
+@intermediate('abs', 'arr')
+def abs_np(arr):
+    return np.abs(arr)
+
+
+@intermediate('median', 'arr')
+def median_np(arr):
+    return np.median(arr, axis=-1)
+
+
+# sample-to-sample differences
+@intermediate('diff', 'arr')
+def diff_np(arr):
+    return np.diff(arr, axis=-1)
+
+
+@intermediate('abs_diff', 'diff')
+def abs_diff_np(diff):
+    return np.abs(diff)
+
+
+@intermediate('sign', 'arr')
+def sign_np(arr):
+    return np.sign(arr)
+
+
+# number of sign changes between consecutive samples, shared by zerocr and slope_change
+@intermediate('sign_changes', 'sign')
+def sign_changes_np(sign):
+    return np.count_nonzero(sign[..., 1:] != sign[..., :-1], axis=-1)
+
+
+# complex64 for float32 windows (numpy's FFT itself always runs in double precision)
+@intermediate('rfft', 'arr')
+def rfft_np(arr):
+    return np.fft.rfft(arr, axis=-1).astype(np.result_type(arr.dtype, np.complex64), copy=False)
+
+
+@intermediate('cumspec', 'spectrum')
+def cumspec_np(spectrum):
+    return np.cumsum(spectrum, axis=-1)
+
+
+@intermediate('spectrum_mean', 'spectrum')
+def spectrum_mean_np(spectrum):
+    return np.mean(spectrum, axis=-1)
+
+
+@intermediate('spectrum_centered', 'spectrum', 'spectrum_mean')
+def spectrum_centered_np(spectrum, spectrum_mean):
+    return spectrum - spectrum_mean[..., None]
+
+
+@intermediate('spectrum_variance', 'spectrum_centered')
+def spectrum_variance_np(spectrum_centered):
+    return np.mean(spectrum_centered ** 2, axis=-1)
+
+
+# energy of the first half of the spectrum, which the median frequency balances
+@intermediate('spectral_energy', 'spectrum', 'n')
+def spectral_energy_np(spectrum, n):
+    return spectrum[..., :n // 2] ** 2
+
+
+@intermediate('cumenergy', 'spectral_energy')
+def cumenergy_np(spectral_energy):
+    return np.cumsum(spectral_energy, axis=-1)
+
+
+# one-sided periodogram of the mean-removed signal (scaling is irrelevant, it is only used normalised)
+@intermediate('power', 'rfft', 'n')
+def power_np(rfft, n):
+    power = np.abs(rfft) ** 2
+    power[..., 0] = 0
+    if n % 2:
+        power[..., 1:] *= 2
+    else:
+        power[..., 1:-1] *= 2
+
+    return power
+
+
+# autocovariance of lags 0..4, the input of the order-4 Yule-Walker fit
+@intermediate('autocovariance', 'centered')
+def autocovariance_np(centered):
+    return AutoRegression.autocovariance(centered, order=4)
+
+
+# magnitude spectrum of x + y + z; the FFT is linear, so it is built from the sum of the per-axis rffts
+@intermediate('spectrum_of_sum', 'rfft', 'n')
+def spectrum_of_sum_np(rfft, n):
+    return one_sided_spectrum(np.sum(rfft, axis=-2), n)
+
+
+# ------------------------------------------------ numpy backend ----------------------------------------------------- #
+# Array-native versions of the features. Each of them takes arrays of shape (..., axes, samples), or the
+# intermediates derived from them, and reduces over the last axis, so all axes of a window, or of a whole batch of
+# windows, are computed at once. The per-axis sums and moments are intermediates of their own: the features are
+# cheap functions of them, and the streaming engine maintains them incrementally instead.
+
+
+# Axis pairs of the pairwise features as (first, second) index arrays, in row-major order of the upper triangle of the
+# axes' correlation matrix; for x, y, z: xy, xz, yz
+@lru_cache(maxsize=None)
+def axis_pairs(count):
+    return np.triu_indices(count, 1)
+
+
+# Upper triangle of a (..., axes, axes) matrix, one value per axis pair
+def pair_values(matrix):
+    first, second = axis_pairs(matrix.shape[-1])
+    return matrix[..., first, second]
+
+
+# Gram matrix (..., axes, axes) of the axes of (..., axes, samples) signals
+def gram_np(arr):
+    return arr @ np.swapaxes(arr, -1, -2)
+
+
+# Window DataFrame to (axes, samples) float array
+def to_array(data, dtype=np.float64):
+    if dtype not in FLOAT_DTYPES:
+        raise ValueError(f"unsupported feature dtype: {dtype}")
+
+    # DataFrames are recognised without importing pandas
+    if hasattr(data, 'to_numpy'):
+        return data.to_numpy(dtype=dtype).T
+    return np.asarray(data, dtype=dtype)
+
+
+# sample variance with the given correction, as in the training set
+def stdev_np(variance, n, correction=1):
+    return variance * n / (n - correction)
+
+
+# central moments of order 3 and 4, of the samples and of the magnitude spectrum
+@intermediate('moment3', 'centered')
+def moment3_np(centered):
+    # products instead of ** 3 / ** 4, which go through the much slower generic power
+    return np.mean(centered * centered * centered, axis=-1)
+
+
+@intermediate('moment4', 'centered')
+def moment4_np(centered):
+    squared = centered * centered
+    return np.mean(squared * squared, axis=-1)
+
+
+intermediate('spectrum_moment3', 'spectrum_centered')(moment3_np)
+intermediate('spectrum_moment4', 'spectrum_centered')(moment4_np)
+
+
+def kurtosis_np(moment4, variance):
+    return moment4 / variance ** 2
+
+
+def skewness_np(moment3, variance):
+    return moment3 / variance ** 1.5
+
+
+@intermediate('sum_squares', 'arr')
+def sum_squares_np(arr):
+    return np.sum(arr ** 2, axis=-1)
+
+
+def rms_np(sum_squares, n):
+    return np.sqrt(sum_squares / n)
+
+
+def energy_np(abs):
+    return np.mean(abs ** 2, axis=-1)
+
+
+@intermediate('sum_abs', 'abs')
+def mav_np(abs):
+    return np.sum(abs, axis=-1)
+
+
+def logdetect_np(abs):
+    return np.exp(np.mean(np.log10(abs), axis=-1))
+
+
+def p2p_np(arr):
+    return np.ptp(arr, axis=-1)
+
+
+def mad_np(arr, median):
+    return np.median(np.abs(arr - median[..., None]), axis=-1)
+
+
+# The sequential features read the shared diff and sign intermediates, so they do not depend on how the window
+# was indexed.
+@intermediate('waveform_length', 'abs_diff')
+def wf_np(abs_diff):
+    return np.sum(abs_diff, axis=-1)
+
+
+@intermediate('wilson_amp', 'abs_diff')
+def wilson_amp_np(abs_diff, t=0.05):
+    return np.sum(np.sign(abs_diff - t), axis=-1)
+
+
+# mean over samples of |x| + |y| + |z|, from the per-axis sums of absolute values
+def sma_np(sum_abs, n):
+    return np.sum(sum_abs, axis=-1) / n
+
+
+# The pairwise features are read from the correlation matrices of all axes at once
+@intermediate('cross_products', 'arr')
+def crossco_np(arr):
+    return pair_values(gram_np(arr))
+
+
+# population covariance of every axis pair
+@intermediate('covariance', 'centered')
+def covariance_np(centered):
+    return pair_values(gram_np(centered)) / centered.shape[-1]
+
+
+def corecoef_np(covariance, variance):
+    first, second = axis_pairs(variance.shape[-1])
+    return covariance / np.sqrt(variance[..., first] * variance[..., second])
+
+
+def mpf_np(spectrum, freqs):
+    return np.sum(spectrum * freqs, axis=-1) / np.sum(spectrum, axis=-1)
+
+
+# Frequencies at which a cumulative spectrum reaches each fraction in q, for all axes (and windows) in one pass.
+# Returns shape (..., len(q)), or bin indices if freqs is None. The exact mode is a searchsorted (side='left') of the
+# normalised cumulative sum; compat reproduces the training set, which searches from bin 1 and also requires
+# round(fraction, 2) >= q.
+def spectral_quantiles(cumulative, q, freqs=None, compat=True):
+    q = np.atleast_1d(q)[:, None]
+    norm_arr = (cumulative / cumulative[..., -1:])[..., None, :]
+
+    if compat:
+        reached = (norm_arr >= q) & (np.round(norm_arr, 2) >= q)
+        reached[..., 0] = False
+        index = np.argmax(reached, axis=-1)
+    else:
+        # the normalised cumulative sum is non-decreasing, so counting the bins below q is searchsorted
+        index = np.count_nonzero(norm_arr < q, axis=-1)
+
+    return index if freqs is None else freqs[index]
+
+
+def iqr_np(cumspec, freqs, compat=True):
+    quartiles = spectral_quantiles(cumspec, (0.25, 0.75), freqs, compat)
+    return quartiles[..., 1] - quartiles[..., 0]
+
+
+# Bisection of the training set for one signal, on the energies left (c[:k]) and right (c[k:]) of every bin k
+def bisect_energy(sum_left, sum_right, n):
+    prev_bep = int(n / 2)
+    prev_diff = 10e12
+    prev_left = 10e13
+    rep_count = 0
+    counter = 2
+
+    while True:
+        step = int(n / (2 ** counter))
+        # once the step is zero no bin moves any more, the remaining rounds only count repeats up to the stop
+        if step == 0:
+            return prev_bep
+
+        left, right = sum_left[prev_bep], sum_right[prev_bep]
+        curr_diff = abs(right - left)
+        rep_count += left == prev_left
+        if left == right or rep_count == 10 or curr_diff >= 15 * prev_diff:
+            return prev_bep
+
+        prev_bep += step if left < right else -step
+        prev_diff, prev_left = curr_diff, left
+        counter += 1
+
+
+# signals up to which the bisection runs signal by signal in plain Python, cheaper than the vectorised rounds
+SCALAR_BISECTION = 8
+
+
+# Bin index balancing the energy of the first half of the spectrum. compat runs the bisection of the training set for
+# every axis in lockstep; otherwise it is the exact median of the cumulative energy.
+def median_frequency_np(energy, cumenergy=None, compat=True):
+    if not compat:
+        if cumenergy is None:
+            cumenergy = np.cumsum(energy, axis=-1)
+        return spectral_quantiles(cumenergy, 0.5, compat=False)[..., 0]
+
+    shape = energy.shape[:-1]
+    n = energy.shape[-1]
+    energy = energy.reshape(int(np.prod(shape)), n)
+    zeros = np.zeros((len(energy), 1))
+
+    # sum_left[:, k] is the energy of c[:k], sum_right[:, k] the energy of c[k:]
+    sum_left = np.concatenate([zeros, np.cumsum(energy, axis=-1)], axis=-1)
+    sum_right = np.concatenate([np.cumsum(energy[:, ::-1], axis=-1)[:, ::-1], zeros], axis=-1)
+
+    if len(energy) <= SCALAR_BISECTION:
+        bep = [bisect_energy(left, right, n) for left, right in zip(sum_left.tolist(), sum_right.tolist())]
+        return np.array(bep, dtype=int).reshape(shape)
+
+    # rows are the signals still searching; the state of a signal is dropped once it stops
+    bep = np.full(len(energy), int(n / 2))
+    rows = np.arange(len(energy))
+    prev_diff = np.full(len(energy), 10e12)
+    prev_left = np.full(len(energy), 10e13)
+    rep_count = np.zeros(len(energy), dtype=int)
+    counter = 2
+
+    while len(rows):
+        step = int(n / (2 ** counter))
+        # once the step is zero no bin moves any more, the remaining rounds only count repeats up to the stop
+        if step == 0:
+            break
+
+        left = sum_left[rows, bep[rows]]
+        right = sum_right[rows, bep[rows]]
+        curr_diff = np.abs(right - left)
+        rep_count += left == prev_left
+        going = ~((left == right) | (rep_count == 10) | (curr_diff >= 15 * prev_diff))
+
+        # move towards the heavier side
+        rows = rows[going]
+        bep[rows] += step * ((left < right) * 1 - (left > right))[going]
+        prev_diff, prev_left, rep_count = curr_diff[going], left[going], rep_count[going]
+        counter += 1
+
+    return bep.reshape(shape)
+
+
+# Bin indices, in ascending order, of the three highest peaks of a magnitude spectrum; NaN if there are fewer
+def top3_np(spectrum):
+    n = spectrum.shape[-1]
+    peaks = np.zeros(spectrum.shape, dtype=bool)
+    peaks[..., 1:-1] = (spectrum[..., 1:-1] > spectrum[..., :-2]) & (spectrum[..., 1:-1] > spectrum[..., 2:])
+
+    highest = np.argsort(np.where(peaks, spectrum, -np.inf), axis=-1)[..., -3:]
+    found = np.take_along_axis(peaks, highest, axis=-1)
+    top3_value = np.sort(np.where(found, highest, n), axis=-1).astype(np.float64)
+    top3_value[top3_value == n] = np.nan
+
+    return top3_value
+
+
+# Shannon entropy (base 2) of the normalised power spectrum, zero bins contribute nothing
+def spectral_entropy_np(power):
+    psd_norm = power / np.sum(power, axis=-1, keepdims=True)
+    xlogx = np.zeros(psd_norm.shape, dtype=psd_norm.dtype)
+    valid = psd_norm > 0
+    xlogx[valid] = psd_norm[valid] * np.log2(psd_norm[valid])
+
+    return -np.sum(xlogx, axis=-1)
+
+
+# Order-4 AR coefficients of every axis, see AutoRegression
+def autoregyw_np(autocovariance):
+    return AutoRegression.yule_walker(autocovariance)
+
+
+def autoregburg_np(centered):
+    return AutoRegression.burg(centered, order=4)
+
+
+# filter length of the sym4 wavelet, so the column layout is known without importing pywt
+WAVELET_FILTER_LENGTH = 8
+
+
+@lru_cache(maxsize=None)
+def wavelet():
+    return backend('pywt').Wavelet('sym4')
+
+
+# Number of wavelet bands (detail levels plus approximation) of an n-sample window, as pywt.dwt_max_level + 1
+@lru_cache(maxsize=None)
+def wavelet_levels(n):
+    if n < WAVELET_FILTER_LENGTH - 1:
+        return 1
+    return int(np.floor(np.log2(n / (WAVELET_FILTER_LENGTH - 1)))) + 1
+
+
+def enwatco_np(arr):
+    decomp = wavelet_levels(arr.shape[-1])
+    # all axes (and windows) are decomposed in one call along the sample axis
+    x_vec = backend('pywt').wavedec(arr, wavelet(), level=decomp - 1, axis=-1)
+
+    # the training set keeps a single coefficient (index -decomp) of every band, scaled by the approximation length
+    energies = np.stack([band[..., -decomp] for band in x_vec], axis=-1)
+    return np.abs(energies) / x_vec[-decomp].shape[-1]
+
+
 # --------------------------------------------------- frequency ------------------------------------------------------ #
+# Per-feature functions for a single window (DataFrame or (axes, samples) array). ctx shares the intermediates
+# between calls on the same window.
 
 
-# Time and frequency
-# Kurtosis
-def kurtosis(data):
-    kurtosis_value = []
-    global gg
+# Values of a registered feature for one window
+def feature_values(name, data, ctx=None):
+    if ctx is None:
+        ctx = WindowContext(data)
 
-    datawt = data
-    for l in ['t', 'f']:
-        for n in datawt.columns:
-            gg.append(f"acc_{n}_kurtosis_{l}")
+    return list(np.ravel(ctx.run(FEATURES_BY_NAME[name])))
 
-    for n in datawt.columns:
-        length = len(data[n])
-        mean_value = sum(data[n]) / length
-        std = (sum((var - mean_value) ** 2 for var in data[n]) / length) ** 0.5
-        kurt = (sum((var - mean_value) ** 4 for var in data[n]) / (length * std ** 4))
-        kurtosis_value.append(kurt)
 
-    for n in datawt.columns:
-        ff, ffv = fft_sig(data[n])
-        lengthf = len(ffv)
-        meanf = sum(ffv) / lengthf
-        stdf = (sum((var - meanf) ** 2 for var in ffv) / lengthf) ** 0.5
-        kurtf = (sum((var - meanf) ** 4 for var in ffv) / (lengthf * stdf ** 4))
-        kurtosis_value.append(kurtf)
+# Time and frequency
+# Kurtosis
+def kurtosis(data, ctx=None):
+    if ctx is None:
+        ctx = WindowContext(data)
 
-    return kurtosis_value
+    return feature_values('kurtosis_t', data, ctx) + feature_values('kurtosis_f', data, ctx)
 
 
 # Time and frequency
 # Skewness
-def skewness(data):
-    skewness_value = []
-    global gg
-    datawt = data
-    for l in ['t', 'f']:
-        for n in datawt.columns:
-            gg.append(f"acc_{n}_skewness_{l}")
-
-    for col in datawt.columns:
-        n = len(data[col])
-        mean_value = sum(data[col]) / n
-        std = (sum((x - mean_value) ** 2 for x in data[col]) / n) ** 0.5
-        skew = (sum((x - mean_value) ** 3 for x in data[col]) / (n * std ** 3))
-        skewness_value.append(skew)
-
-    for col in datawt.columns:
-        ff, ffv = fft_sig(data[col])
-        nf = len(ffv)
-        meanf = sum(ffv) / nf
-        std = (sum((x - meanf) ** 2 for x in ffv) / nf) ** 0.5
-        skew = (sum((x - meanf) ** 3 for x in ffv) / (nf * std ** 3))
-        skewness_value.append(skew)
-
-    return skewness_value
+def skewness(data, ctx=None):
+    if ctx is None:
+        ctx = WindowContext(data)
+
+    return feature_values('skewness_t', data, ctx) + feature_values('skewness_f', data, ctx)
 
 
 # Energy wavelet coefficient
-def enwatco(data):
-    enwatco_value = []
-    datawt = data
-    for n in datawt.columns:
+def enwatco(data, ctx=None):
+    return feature_values('enwatco', data, ctx)
 
-        db = pywt.Wavelet('sym4')
-        decomp = pywt.dwt_max_level(len(data), db) + 1
-        x_vec = [None] * decomp
-        x_vec = pywt.wavedec(data[n], db)
-        energy_x = []
 
-        for row in range(decomp):
-            energy_x.append(np.sqrt(np.sum(np.array(x_vec[row][-decomp]) ** 2)) / len(x_vec[-decomp]))
-        enwatco_value.append(energy_x)
+# Top 3 value
+def top3(data, ctx=None):
+    return feature_values('top3', data, ctx)
 
-    n = len(enwatco_value[0])
-    for m in ['z', 'y', 'x']:
 
-        for i in range(1, n + 1):
-            gg.append(f"acc_{m}_enwacto_{i}")
+# Energy needed to median frequency
+def medianenergy(data):
+    data = np.asarray(data)
+    n = len(data) - len(data) % 2
+    energy_arr = np.abs(data[:n // 2]) ** 2
 
-    enwacto_final = [*enwatco_value[0], *enwatco_value[1], *enwatco_value[2]]
+    return np.sum(energy_arr) / n, energy_arr
 
-    return enwacto_final
 
+# Median frequency
+def median_frequency(data, ctx=None, compat=None):
+    if ctx is None:
+        ctx = WindowContext(data)
+    if compat is None:
+        compat = QUANTILE_COMPAT
 
-# Top 3 value
-def top3(data):
-    sig = np.sum(data.loc[:, ['x', 'y', 'z']], axis=1)
-    frequency_sampling = 100
-    n = len(sig)
-    frequency_vector = np.arange(0, frequency_sampling, frequency_sampling / n)
-    com_fft = np.abs(np.fft.fft(sig)) / n
-    com_fft[1:int(np.ceil(n / 2) + 1)] = com_fft[1:int(np.ceil(n / 2) + 1)] * 2
-    com_fft[int(np.ceil(n / 2) + 1):].fill(0)
-
-    _, abs_fft_modified = frequency_vector, com_fft
-    peaks_modified, _ = signal.find_peaks(abs_fft_modified, height=0)
-    top3_value = np.in1d(abs_fft_modified, np.sort(abs_fft_modified[peaks_modified])[-3:]).nonzero()[0]
-    global gg
-    datawt = data
-    for n in datawt.columns:
-        gg.append(f"acc_{n}_top3")
+    return list(median_frequency_np(ctx.spectral_energy, ctx.cumenergy, compat))
 
-    return top3_value
 
+# Interquartile range
+def iqr(dataf, ctx=None, compat=None):
+    if ctx is None:
+        ctx = WindowContext(dataf)
+    if compat is None:
+        compat = QUANTILE_COMPAT
 
-# Energy needed to median frequency
-def medianenergy(data):
-    energy_df = pd.DataFrame(data)
-    n = len(energy_df)
-    if n % 2 != 0:
-        n -= 1
-    energy_arr = []
-    total_energy = 0
+    return list(iqr_np(ctx.cumspec, ctx.freqs, compat))
 
-    for i in range(int(n / 2)):
-        temp_energy = np.abs(energy_df[0][i]) ** 2
-        energy_arr.append(temp_energy)
-        total_energy += temp_energy
-    total_energy = total_energy / n
 
-    return total_energy, energy_arr
+# Three quarters of frequency
+def three_quarters(data, ctx=None, compat=None):
+    if ctx is None:
+        ctx = WindowContext(data)
+    if compat is None:
+        compat = QUANTILE_COMPAT
 
+    return list(spectral_quantiles(ctx.cumspec, 0.75, ctx.freqs, compat)[..., 0])
 
-# Median frequency
-def median_frequency(data):
-    median_frequency_value = []
-    global gg
-    datawt = data
-    for n in datawt.columns:
-        gg.append(f"acc_{n}_median_frequency")
-        _, m = fft_sig(data[n])
-        _, c = medianenergy(m)
-        n = len(c)
-        prev_bep = int(n / 2)
-        bep = int(n / 2)
-        counter = 2
-        prev_diff = 10e12
-        rep_count = 0
-        prev_left = 10e13
-
-        while True:
-            sum_left = sum(x for x in c[:bep])
-            sum_right = sum(y for y in c[bep:])
-
-            if sum_left < sum_right:
-                bep = prev_bep + int(n / (2 ** counter))
-
-            elif sum_left > sum_right:
-                bep = prev_bep - int(n / (2 ** counter))
-
-            else:
-                break
-
-            curr_diff = np.abs(sum_right - sum_left)
-
-            if sum_left == prev_left:
-                rep_count += 1
-
-            if rep_count == 10:
-                break
-
-            if curr_diff >= 15 * prev_diff:
-                break
-
-            else:
-                prev_bep = bep
-                prev_diff = curr_diff
-                counter += 1
-                prev_left = sum_left
-        median_frequency_value.append(prev_bep)
-    return median_frequency_value
 
+# One quarter of frequency
+def one_quarter(data, ctx=None, compat=None):
+    if ctx is None:
+        ctx = WindowContext(data)
+    if compat is None:
+        compat = QUANTILE_COMPAT
 
-# ------------------------------------------------------ time -------------------------------------------------------- #
+    return list(spectral_quantiles(ctx.cumspec, 0.25, ctx.freqs, compat)[..., 0])
 
 
-# Peak to peak
-def p2p(data):
-    p2p_value = []
-    global gg
-    datawt = data
-    for col in datawt.columns:
-        minim = min(data[col])
-        maxim = max(data[col])
-        p2p_value.append(maxim - minim)
-        gg.append(f"acc_{col}_p2p")
+# Mean power frequency
+def mpf(data, ctx=None):
+    return feature_values('mpf', data, ctx)
 
-    return p2p_value
 
+# Entropy
+def entropy(data, ctx=None):
+    return feature_values('entropy', data, ctx)
 
-# Mean absolute value
-def mav(data):
-    mav_value = []
-    global gg
-    datawt = data
-    for col in datawt.columns:
-        mean_sum = sum(abs(x) for x in data[col])
-        mav_value.append(mean_sum)
-        gg.append(f"acc_{col}_mav")
 
-    return mav_value
+# ------------------------------------------------------ time -------------------------------------------------------- #
 
 
-# Waveform length
-def wf(data):
-    wf_value = []
-    global gg
-    datawt = data
-    for col in datawt.columns:
-        n = len(data[col])
-        waveform = 0
+# Peak to peak
+def p2p(data, ctx=None):
+    return feature_values('p2p', data, ctx)
+
+
+# Mean absolute value
+def mav(data, ctx=None):
+    return feature_values('mav', data, ctx)
 
-        for i in range(n - 1):
-            waveform += abs(data[col][i + 1] - data[col][i])
-        wf_value.append(waveform)
-        gg.append(f"acc_{col}_wf")
 
-    return wf_value
+# Waveform length
+def wf(data, ctx=None):
+    return feature_values('wf', data, ctx)
 
 
 # Log detector
-def logdetect(data):
-    logdetect_value = []
-    global gg
-    datawt = data
-    for col in datawt.columns:
-        n = len(data[col])
-        logdetect_value.append(math.exp(sum(math.log10(abs(x)) for x in data[col]) * 1 / n))
-        gg.append(f"acc_{col}_logdetect")
+def logdetect(data, ctx=None):
+    if ctx is None:
+        ctx = WindowContext(data)
 
-    return logdetect_value
+    return list(logdetect_np(ctx.abs))
 
 
 # Zero crossing
-def zerocr(data):
-    zerocr_value = []
-    global gg
-    datawt = data
-    for n in datawt.columns:
-        zero_crossinga = np.where(np.diff(np.sign(data[n])))[0]
-        zc1 = len(zero_crossinga)
-        zerocr_value.append(zc1)
-        gg.append(f"acc_{n}_zerocr")
-
-    return zerocr_value
+def zerocr(data, ctx=None):
+    return feature_values('zerocr', data, ctx)
 
 
 # Median absolute deviation
-def mad(data):
-    mad_value = []
-    global gg
-    datawt = data
-    for n in datawt.columns:
-        median_number = np.median(data[n])
-        mad1 = np.median([abs(var - median_number) for var in data[n]])
-        mad_value.append(mad1)
-        gg.append(f"acc_{n}_mad")
-
-    return mad_value
+def mad(data, ctx=None):
+    return feature_values('mad', data, ctx)
 
 
 # Mean value
-def mean(data):
-    mean_value = []
-    global gg
-    datawt = data
-    for col in datawt.columns:
-        value = sum(data[col]) / len(data[col])
-        mean_value.append(value)
-        gg.append(f"acc_{col}_mean")
-
-    return mean_value
+def mean(data, ctx=None):
+    return feature_values('mean', data, ctx)
 
 
 # Standard deviation
-def stdev(data, correction=1):
-    stdev_value = []
-    global gg
-    datawt = data
-    for col in datawt.columns:
-        n = len(data[col])
-        value = sum(data[col]) / n
-        dev = sum((x - value) ** 2 for x in data[col]) / (n - correction)
-        stdev_value.append(dev)
-        gg.append(f"acc_{col}_stdev")
+def stdev(data, correction=1, ctx=None):
+    if ctx is None:
+        ctx = WindowContext(data)
 
-    return stdev_value
+    return list(stdev_np(ctx.variance, ctx.n, correction))
 
 
 # Root mean square
-def rms(data):
-    rms_value = []
-    global gg
-    datawt = data
-    for col in datawt.columns:
-        n = len(data[col])
-        value = math.sqrt(sum(x ** 2 for x in data[col]) / n)
-        rms_value.append(value)
-        gg.append(f"acc_{col}_rms")
-
-    return rms_value
+def rms(data, ctx=None):
+    return feature_values('rms', data, ctx)
 
 
 # Energy
-def energy(data):
-    energy_value = []
-    global gg
-    datawt = data
-    for col in datawt.columns:
-        n = len(data[col])
-        value = sum(abs(x) ** 2 for x in data[col]) / n
-        energy_value.append(value)
-        gg.append(f"acc_{col}_energy")
+def energy(data, ctx=None):
+    if ctx is None:
+        ctx = WindowContext(data)
 
-    return energy_value
+    return list(energy_np(ctx.abs))
 
 
 # Slope sign change
-def slope_change(data):
-    change = 0
-    slope_change_value = []
-    global gg
-    datawt = data
-    for col in datawt.columns:
-        change = 0
+def slope_change(data, ctx=None):
+    return feature_values('slope_change', data, ctx)
 
-        for i in range(1, len(data)):
 
-            if np.sign(data[col][i]) != np.sign(data[col][i - 1]):
-                change += 1
+# 4th order auto regressive coefficient
+def autoregyw(data, ctx=None):
+    return feature_values('autoregyw', data, ctx)
 
-        slope_change_value.append(change)
-        gg.append(f"acc_{col}_slope_change")
 
-    return slope_change_value
+# Auto-regression coefficients with Burg order equal to four correlation coefficients between two signals
+def autoregburg(data, ctx=None):
+    return feature_values('autoregburg', data, ctx)
 
 
-# 4th order auto regressive coefficient
-def autoregyw(data):
-    autoregyw_value = []
+# Signal magnitude area
+def sma(data, ctx=None):
+    return feature_values('sma', data, ctx)[0]
 
-    global gg
-    datawt = data
-    for col in datawt.columns:
-        a, sigma = sm.regression.yule_walker(data[col], order=4)
-        autoregyw_value.append(a)
 
-        for i in range(1, 5):
-            gg.append(f"acc_{col}_autoregyw_{i}")
+# Correlation coefficient
+def corecoef(data, ctx=None):
+    return tuple(feature_values('corecoef', data, ctx))
 
-    autoregyw_value_final = [*autoregyw_value[0], *autoregyw_value[1], *autoregyw_value[2]]
 
-    return autoregyw_value_final
+# Cross correlation between axes
+def crossco(data, ctx=None):
+    return tuple(feature_values('crossco', data, ctx))
 
 
-# Auto-regression coefficients with Burg order equal to four correlation coefficients between two signals
-def autoregburg(data):
-    autoregburg_value = []
-    global gg
-    datawt = data
-    for col in datawt.columns:
-        a, _ = sm.regression.linear_model.burg(data[col], order=4)
-        autoregburg_value.append(a)
+# Wilson amplitude
+def wilson_amp(data, t=0.05, ctx=None):
+    if ctx is None:
+        ctx = WindowContext(data)
 
-        for i in range(1, 5):
-            gg.append(f"acc_{col}_autoregburg_{i}")
+    return list(wilson_amp_np(ctx.abs_diff, t))
 
-    autoregburg_value_final = [*autoregburg_value[0], *autoregburg_value[1], *autoregburg_value[2]]
 
-    return autoregburg_value_final
+# ------------------------------------------------------ schema ------------------------------------------------------ #
+# Every stage of the feature row in the order it is emitted. Column names depend only on the window's axes and
+# length, so they are declared here once instead of being collected while the window is computed. A stage is
+# computed as func(*needs), where needs name intermediates, and returns values of shape (..., width). backends lists
+# the optional backends the stage imports. A stage whose values are computed axis by axis, its columns laid out axis
+# after axis, lists in axis_needs its needs of shape (..., axes, k): the plan then runs it on the requested axes only.
+
 
+Feature = namedtuple('Feature', ['name', 'func', 'columns', 'needs', 'backends', 'axis_needs'], defaults=((), ()))
 
-# Signal magnitude area
-def sma(data):
-    n = len(data)
-    x = data['x']
-    y = data['y']
-    z = data['z']
-    sma_value = 0
-    global gg
-    gg.append("acc_mpf")
 
-    for i in range(n):
-        sma_value += np.abs(x[i]) + np.abs(y[i]) + np.abs(z[i])
+# Column prefix of a channel: the x, y, z accelerometer axes keep the acc_ names of the training set, other channels
+# are named after themselves (gyr-x -> gyr_x)
+def channel_prefix(axis):
+    return f"acc_{axis}" if axis in AXES else axis.replace('-', '_')
 
-    return sma_value / n
 
+# the x, y, z window keeps the column layout of the training set
+def legacy_layout(axes):
+    return tuple(axes) == AXES
 
-# Correlation coefficient
-def corecoef(data):
-    ccxy = np.corrcoef(data['x'], data['y'])
-    ccxz = np.corrcoef(data['x'], data['z'])
-    ccyz = np.corrcoef(data['y'], data['z'])
-    datawt = data
-    for i in datawt.columns:
-        gg.append(f"acc_{i}_corecoef")
 
-    return ccxy[1, 0], ccxz[1, 0], ccyz[1, 0]
+def axis_columns(suffix):
+    return lambda axes, n: [f"{channel_prefix(a)}_{suffix}" for a in axes]
 
 
-# Cross correlation between axes
-def crossco(data):
-    global gg
-    corrxy = np.correlate(data['x'], data['y'])
-    corrxz = np.correlate(data['x'], data['z'])
-    corryz = np.correlate(data['y'], data['z'])
+# pairwise columns; the training set stores the x, y, z pairs (xy, xz, yz) under the axis names
+def pair_columns(suffix):
+    def columns(axes, n):
+        if legacy_layout(axes):
+            return axis_columns(suffix)(axes, n)
+        return [f"{channel_prefix(axes[a])}_{channel_prefix(axes[b])}_{suffix}" for a, b in zip(*axis_pairs(len(axes)))]
 
-    datawt = data
-    for i in datawt.columns:
-        gg.append(f"acc_{i}_crossco")
+    return columns
 
-    return corrxy[0], corrxz[0], corryz[0]
 
+# columns of a per-axis feature with several values per axis
+def indexed_columns(suffix, count):
+    return lambda axes, n: [f"{channel_prefix(a)}_{suffix}_{i}" for a in axes for i in range(1, count + 1)]
 
-# Wilson amplitude
-def wilson_amp(data, t=0.05):
-    cols = ['x', 'y', 'z']
-    wa = []
-    for col in cols:
-        gg.append(f"acc_{col}_wilson_amp")
-        n = len(data[col])
-        amp = 0
 
-        for i in range(n - 1):
-            amp += np.sign(abs(data[col][i + 1] - data[col][i]) - t)
+# the top 3 peaks are those of the sum of all axes; the training set stores them under the axis names
+def top3_columns(axes, n):
+    return axis_columns('top3')(axes, n) if legacy_layout(axes) else [f"top3_{i}" for i in range(1, 4)]
 
-        wa.append(amp)
 
-    return wa
+# signal magnitude area of all axes, named acc_mpf in the training set
+def sma_columns(axes, n):
+    return ["acc_mpf"] if legacy_layout(axes) else ["sma"]
 
 
-# Interquartile range
-def iqr(dataf):
-    iqr_value = []
-    global gg 
-    q1 = one_quarter(dataf, flag=False)
-    q3 = three_quarters(dataf, flag=False)
-    for i in range(len(q1)):
-        iqr_value.append(q3[i] - q1[i])
+# the training set labels the wavelet energies z, y, x although they are computed x, y, z
+def enwatco_columns(axes, n):
+    axes = reversed(axes) if legacy_layout(axes) else axes
+    return indexed_columns('enwacto', wavelet_levels(n))(axes, n)
 
-    datawt = dataf
-    for i in datawt.columns:
-        gg.append(f"acc_{i}_iqr")
 
-    return iqr_value
+FEATURES = (
+    Feature('mpf', mpf_np, axis_columns('mpf'), ('spectrum', 'freqs')),
+    Feature('iqr', lambda cumspec, freqs: iqr_np(cumspec, freqs, QUANTILE_COMPAT), axis_columns('iqr'),
+            ('cumspec', 'freqs'), axis_needs=('cumspec',)),
+    Feature('wilson_amp', lambda wilson_amp: wilson_amp, axis_columns('wilson_amp'), ('wilson_amp',)),
+    Feature('crossco', lambda cross_products: cross_products, pair_columns('crossco'), ('cross_products',)),
+    Feature('three_quarters', lambda cumspec, freqs: spectral_quantiles(cumspec, 0.75, freqs, QUANTILE_COMPAT),
+            axis_columns('three_quarters'), ('cumspec', 'freqs'), axis_needs=('cumspec',)),
+    Feature('one_quarter', lambda cumspec, freqs: spectral_quantiles(cumspec, 0.25, freqs, QUANTILE_COMPAT),
+            axis_columns('one_quarter'), ('cumspec', 'freqs'), axis_needs=('cumspec',)),
+    Feature('corecoef', corecoef_np, pair_columns('corecoef'), ('covariance', 'variance')),
+    Feature('sma', lambda sum_abs, n: sma_np(sum_abs, n)[..., None], sma_columns, ('sum_abs', 'n')),
+    Feature('slope_change', lambda sign_changes: sign_changes, axis_columns('slope_change'), ('sign_changes',)),
+    Feature('rms', rms_np, axis_columns('rms'), ('sum_squares', 'n')),
+    Feature('stdev', stdev_np, axis_columns('stdev'), ('variance', 'n')),
+    Feature('mean', lambda mean: mean, axis_columns('mean'), ('mean',)),
+    Feature('mad', mad_np, axis_columns('mad'), ('arr', 'median')),
+    Feature('zerocr', lambda sign_changes: sign_changes, axis_columns('zerocr'), ('sign_changes',)),
+    Feature('wf', lambda waveform_length: waveform_length, axis_columns('wf'), ('waveform_length',)),
+    Feature('mav', lambda sum_abs: sum_abs, axis_columns('mav'), ('sum_abs',)),
+    Feature('p2p', p2p_np, axis_columns('p2p'), ('arr',)),
+    Feature('median_frequency',
+            lambda spectral_energy, cumenergy: median_frequency_np(spectral_energy, cumenergy, QUANTILE_COMPAT),
+            axis_columns('median_frequency'), ('spectral_energy', 'cumenergy')),
+    Feature('entropy', spectral_entropy_np, axis_columns('entropy'), ('power',)),
+    # the moments of the samples (_t) and of the magnitude spectrum (_f) are separate stages, so a plan without the
+    # _f columns does not compute the spectral moments
+    Feature('kurtosis_t', kurtosis_np, axis_columns('kurtosis_t'), ('moment4', 'variance')),
+    Feature('kurtosis_f', kurtosis_np, axis_columns('kurtosis_f'), ('spectrum_moment4', 'spectrum_variance')),
+    Feature('skewness_t', skewness_np, axis_columns('skewness_t'), ('moment3', 'variance')),
+    Feature('skewness_f', skewness_np, axis_columns('skewness_f'), ('spectrum_moment3', 'spectrum_variance')),
+    Feature('top3', top3_np, top3_columns, ('spectrum_of_sum',)),
+    Feature('autoregyw', autoregyw_np, indexed_columns('autoregyw', 4), ('autocovariance',),
+            axis_needs=('autocovariance',)),
+    Feature('autoregburg', autoregburg_np, indexed_columns('autoregburg', 4), ('centered',), axis_needs=('centered',)),
+    Feature('enwatco', enwatco_np, enwatco_columns, ('arr',), ('pywt',)),
+)
 
+FEATURES_BY_NAME = {feature.name: feature for feature in FEATURES}
 
-# Three quarters of frequency
-def three_quarters(data, flag=True):
-    three_quarters_value = []
-    global gg
-    datawt = data
-    for i in datawt.columns:
-        fvec, dff = fft_sig(data[i])
-        arr = np.cumsum(dff)
-        norm_arr = arr / arr[-1]
 
-        for j in range(1, len(arr)):
+# Position of every stage in the feature row
+@lru_cache(maxsize=None)
+def feature_layout(axes=AXES, n=WINDOW_LENGTH):
+    layout = []
+    start = 0
+    for feature in FEATURES:
+        width = len(feature.columns(axes, n))
+        layout.append((feature, slice(start, start + width)))
+        start += width
 
-            if norm_arr[j] < 0.75:
-                continue
+    return tuple(layout)
 
-            if round(norm_arr[j], 2) >= 0.75:
-                three_quarters_value.append(fvec[j])
 
-                gg.append(f"acc_{i}_three_quarters") if flag == True else None
-                break
-    return three_quarters_value
+@lru_cache(maxsize=None)
+def feature_names(axes=AXES, n=WINDOW_LENGTH):
+    return tuple(name for feature in FEATURES for name in feature.columns(axes, n))
 
 
-# One quarter of frequency
-def one_quarter(data, flag=True):
-    one_quarter_values = []
-    global gg
-    datawt = data
-    for i in datawt.columns:
+FEATURE_NAMES = feature_names()
 
-        fvec, dff = fft_sig(data[i])
-        arr = np.cumsum(dff)
-        norm_arr = arr / arr[-1]
 
-        for j in range(1, len(arr)):
+# Execution plan for a subset of the feature row: only the stages that own a requested column are run, together with
+# the intermediates and backends they depend on, and stages with axis_needs only on the axes of their requested
+# columns. Columns keep the schema order.
+FeaturePlan = namedtuple('FeaturePlan', ['columns', 'stages', 'intermediates', 'backends'])
 
-            if norm_arr[j] < 0.25:
-                continue
 
-            if round(norm_arr[j], 2) >= 0.25:
-                one_quarter_values.append(fvec[j])
-                gg.append(f"acc_{i}_one_quarter") if flag == True else None
-                break
+# a plain slice when the whole stage is kept avoids a fancy-indexing copy
+def keep_index(keep, width):
+    return slice(None) if len(keep) == width else np.array(keep)
 
-    return one_quarter_values
 
+# Axes (index array, None for all) a stage runs on for the kept columns of its full output, the positions of those
+# columns in its output on these axes, and the width of that output
+def stage_axes(feature, keep, width, count):
+    if not feature.axis_needs:
+        return None, keep, width
 
-# Mean power frequency
-def mpf(data):
-    mean_power_frequency = []
-    datawt = data
+    per_axis = width // count
+    used = sorted({i // per_axis for i in keep})
+    if len(used) == count:
+        return None, keep, width
 
-    global gg
+    return np.array(used), [used.index(i // per_axis) * per_axis + i % per_axis for i in keep], len(used) * per_axis
 
-    for i in datawt.columns:
-        gg.append(f"acc_{i}_mpf")
-        fvec, dff = fft_sig(data[i])
-        value = np.sum(np.multiply(dff, fvec)) / np.sum(dff)
-        mean_power_frequency.append(value)
 
-    return mean_power_frequency
+@lru_cache(maxsize=None)
+def feature_plan(columns=None, axes=AXES, n=WINDOW_LENGTH):
+    names = feature_names(axes, n)
+    requested = names if columns is None else frozenset(columns)
+    unknown = set(requested) - set(names)
+    if unknown:
+        raise ValueError(f"unknown feature columns: {sorted(unknown)}")
+
+    stages = []
+    start = 0
+    for feature, columns in feature_layout(axes, n):
+        keep = [i for i, name in enumerate(names[columns]) if name in requested]
+        if keep:
+            stage_axis, keep, width = stage_axes(feature, keep, columns.stop - columns.start, len(axes))
+            stages.append((feature, stage_axis, keep_index(keep, width), slice(start, start + len(keep))))
+            start += len(keep)
+
+    features = [feature for feature, _, _, _ in stages]
+    return FeaturePlan(tuple(name for name in names if name in requested), tuple(stages),
+                       intermediate_order(features),
+                       tuple(dict.fromkeys(name for feature in features for name in feature.backends)))
 
 
-# Entropy
-def entropy(data):
-    global gg
-    entropy_value = []
-    datawt = data
-    for i in datawt.columns:
-        gg.append(f"acc_{i}_entropy")
-        val = spectral_entropy(data[i], sf=100, method='fft')
-        entropy_value.append(val)
+# Fill the (windows, columns) matrix with the stages of a plan. An optional hook(stage, seconds, shape) is called
+# after every stage with its wall time, which includes the intermediates it is the first to need, and the shape of its
+# output; without a hook the stages run untimed.
+def run_plan(plan, ctx, matrix, hook=None):
+    if hook is None:
+        for feature, axes, keep, columns in plan.stages:
+            matrix[:, columns] = np.reshape(ctx.run(feature, axes), (len(matrix), -1))[:, keep]
+        return matrix
+
+    for feature, axes, keep, columns in plan.stages:
+        start = time.perf_counter()
+        values = ctx.run(feature, axes)
+        hook(feature.name, time.perf_counter() - start, np.shape(values))
+        matrix[:, columns] = np.reshape(values, (len(matrix), -1))[:, keep]
+
+    return matrix
+
+
+# Features of many windows at once: (windows, axes, samples) array to a (windows, features) matrix of the given dtype
+# laid out as feature_names(axes, samples), or as feature_plan(columns).columns if a column subset is given
+def feats_batch(windows, axes=AXES, columns=None, dtype=np.float64, hook=None):
+    windows = to_array(windows, dtype)
+    plan = feature_plan(None if columns is None else frozenset(columns), tuple(axes), windows.shape[-1])
+    matrix = np.empty((windows.shape[0], len(plan.columns)), dtype=dtype)
+
+    # intermediates are computed once for the whole batch and shared by the features
+    return run_plan(plan, WindowContext(windows, dtype=dtype), matrix, hook)
+
+
+# ------------------------------------------------------- stft ------------------------------------------------------- #
+# Spectral features of overlapping windows of a long recording. The frames are a strided view of the signal (no
+# copy) and every block of frames goes through a single batched rfft, from which all spectral stages are derived.
+
+
+SPECTRAL_STAGES = ('mpf', 'iqr', 'three_quarters', 'one_quarter', 'median_frequency', 'entropy', 'kurtosis_f',
+                   'skewness_f', 'top3')
+
+
+# (axes, samples) signal to a (frames, axes, window) view of its windows starting every hop samples
+def sliding_frames(signal, window=WINDOW_LENGTH, hop=WINDOW_LENGTH, dtype=np.float64):
+    signal = to_array(signal, dtype)
+    return np.lib.stride_tricks.sliding_window_view(signal, window, axis=-1)[..., ::hop, :].swapaxes(0, 1)
+
+
+# Columns of the spectral stages
+@lru_cache(maxsize=None)
+def spectral_columns(axes=AXES, n=WINDOW_LENGTH):
+    return tuple(name for feature in FEATURES if feature.name in SPECTRAL_STAGES for name in feature.columns(axes, n))
+
+
+# Features of every frame of a signal as a (frames, columns) matrix laid out as feature_plan(columns).columns;
+# the spectral columns by default. Frames are processed in blocks to bound the memory of the intermediates.
+def stft_features(signal, window=WINDOW_LENGTH, hop=WINDOW_LENGTH, axes=AXES, columns=None, block=1024,
+                  dtype=np.float64):
+    axes = tuple(axes)
+    frames = sliding_frames(signal, window, hop, dtype)
+    plan = feature_plan(frozenset(spectral_columns(axes, window) if columns is None else columns), axes, window)
+    matrix = np.empty((len(frames), len(plan.columns)), dtype=dtype)
+
+    for start in range(0, len(frames), block):
+        run_plan(plan, WindowContext(frames[start:start + block], dtype=dtype), matrix[start:start + block])
+
+    return matrix
+
+
+# Features of a window as a flat row laid out as feature_names(axes, n) or feature_plan(columns).columns
+def feats_row(data, axes=None, columns=None, dtype=np.float64, hook=None):
+    if axes is None:
+        axes = tuple(data.columns) if hasattr(data, 'columns') else AXES
+
+    return feats_batch(to_array(data, dtype)[None], axes, columns, dtype, hook)[0]
+
 
-    return entropy_value
+# Raise on NaN or infinite features, e.g. the top 3 peaks of a spectrum with fewer than three peaks or the moments of
+# a constant axis, which the training set has no rows of
+def check_finite(row, columns):
+    bad = [name for name, value in zip(columns, row) if not np.isfinite(value)]
+    if bad:
+        raise ValueError(f"non-finite features: {', '.join(bad)}")
 
+    return row
 
-def feats_df(data):
-    global gg
 
+# Features of a window as a one-row DataFrame, None if they cannot be computed; hook profiles the stages (see run_plan)
+def feats_df(data, columns=None, dtype=np.float64, hook=None):
     try:
-        mpf_ = (*mpf(data), *iqr(data), *wilson_amp(data), *crossco(data), *three_quarters(data), *one_quarter(data),
-                *corecoef(data), sma(data), *slope_change(data), *rms(data), *stdev(data), *mean(data), *mad(data),
-                *zerocr(data), *wf(data), *mav(data), *p2p(data), *median_frequency(data), *entropy(data),
-                *kurtosis(data), *skewness(data), *top3(data),
-                *autoregyw(data), *autoregburg(data), *enwatco(data)
-                )
-
-        data_frame = pd.DataFrame([mpf_], columns=[*gg])
-        gg = []
-        return data_frame
+        axes = tuple(data.columns)
+        row = feats_row(data, axes, columns, dtype, hook)
+        plan = feature_plan(None if columns is None else frozenset(columns), axes, len(data))
+        return backend('pandas').DataFrame(check_finite(row, plan.columns)[None], columns=plan.columns)
     except Exception as err:
-        gg = []
         print("=====")
         print(err)
         print("=====")
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,200 @@
+import numpy as np
+from SignalFeatures import AXES, FLOAT_DTYPES, WINDOW_LENGTH, WindowContext, axis_pairs, feature_plan, pair_values, \
+    run_plan
+
+# Streaming feature engine: samples are pushed as they arrive and, once the window is full, a feature row of the
+# last `window` samples is emitted every `hop` samples. The time-domain sums (moments, absolute, squared and cross
+# sums, waveform length, wilson amplitude and sign changes) are updated with only the samples entering and leaving
+# the window, O(hop) per row, and handed to the feature graph as precomputed intermediates. Order statistics (p2p,
+# mad) and the spectral, AR and wavelet features are still computed from the whole window.
+#
+# Moments are kept as power sums of (x - shift), shift being the mean of every axis at the last resync, which keeps
+# them well conditioned. Every `resync` samples all sums are recomputed from the window to drop accumulated rounding.
+# With dtype float32 the window and the whole-window features are float32, the running sums stay float64.
+
+
+# Sums over the values of a (axes, samples) block: shifted power sums 1..4, absolute and squared sums, and the raw
+# and shifted cross products of every axis pair
+def value_sums(values, shift):
+    values = values.astype(np.float64, copy=False)
+    shifted = values - shift[:, None]
+    sums = np.stack([np.sum(shifted ** p, axis=-1) for p in range(1, 5)]
+                    + [np.sum(np.abs(values), axis=-1), np.sum(values ** 2, axis=-1)])
+    pair_sums = np.stack([pair_values(values @ values.T), pair_values(shifted @ shifted.T)])
+
+    return sums, pair_sums
+
+
+# Sums over the len(seq) - 1 steps of a (axes, samples) sequence: waveform length, wilson amplitude, sign changes
+def step_sums(seq):
+    abs_diff = np.abs(np.diff(seq.astype(np.float64, copy=False), axis=-1))
+    sign = np.sign(seq)
+
+    return np.stack([np.sum(abs_diff, axis=-1), np.sum(np.sign(abs_diff - 0.05), axis=-1),
+                     np.count_nonzero(sign[:, 1:] != sign[:, :-1], axis=-1)])
+
+
+class StreamingFeatures:
+    def __init__(self, axes=AXES, window=WINDOW_LENGTH, hop=50, columns=None, resync=None, dtype=np.float64,
+                 hook=None):
+        if not 0 < hop <= window:
+            raise ValueError(f"hop must be between 1 and the window length, got {hop}")
+        if dtype not in FLOAT_DTYPES:
+            raise ValueError(f"unsupported feature dtype: {dtype}")
+
+        self.axes = tuple(axes)
+        self.window = window
+        self.hop = hop
+        self.resync_every = window if resync is None else resync
+        self.plan = feature_plan(None if columns is None else frozenset(columns), self.axes, window)
+        self.columns = self.plan.columns
+        self.dtype = dtype
+        # optional per-stage profiling hook, see SignalFeatures.run_plan
+        self.hook = hook
+
+        # ring buffer of the last `window` samples, start is the position of the oldest one
+        self.buffer = np.zeros((len(self.axes), window), dtype=dtype)
+        self.start = 0
+        self.count = 0
+        self.since_row = 0
+        self.since_resync = 0
+
+        self.shift = np.zeros(len(self.axes))
+        self.sums = None
+        self.pair_sums = None
+        self.step_sums = None
+
+    # Window samples in time order
+    def ordered(self):
+        return np.roll(self.buffer, -self.start, axis=-1)
+
+    # Recompute every running sum from the window
+    def resync(self):
+        window = self.ordered()
+        self.shift = np.mean(window, axis=-1)
+        self.sums, self.pair_sums = value_sums(window, self.shift)
+        self.step_sums = step_sums(window)
+        self.since_resync = 0
+
+    # Add samples to a window that is not full yet; the sums are built once it is
+    def fill(self, samples):
+        k = samples.shape[-1]
+        self.buffer[:, self.count:self.count + k] = samples
+        self.count += k
+        if self.count == self.window:
+            self.resync()
+
+    # Add samples to a full window, dropping as many of the oldest ones; needs len(samples) < window
+    def slide(self, samples):
+        k = samples.shape[-1]
+        positions = (self.start + np.arange(k + 1)) % self.window
+        outgoing = self.buffer[:, positions[:-1]]
+        in_sums, in_pairs = value_sums(samples, self.shift)
+        out_sums, out_pairs = value_sums(outgoing, self.shift)
+
+        # the steps leaving the window end at the first sample that stays, the ones entering start at the newest
+        newest = self.buffer[:, (self.start - 1) % self.window, None]
+        self.step_sums += step_sums(np.concatenate([newest, samples], axis=-1)) - step_sums(self.buffer[:, positions])
+        self.sums += in_sums - out_sums
+        self.pair_sums += in_pairs - out_pairs
+
+        self.buffer[:, positions[:-1]] = samples
+        self.start = (self.start + k) % self.window
+        self.since_resync += k
+        if self.since_resync >= self.resync_every:
+            self.resync()
+
+    # Feature row of the current window
+    def row(self):
+        n = self.window
+        s1, s2, s3, s4, sum_abs, sum_squares = self.sums
+        cross_products, shifted_products = self.pair_sums
+        waveform_length, wilson_amp, sign_changes = self.step_sums
+
+        # central moments from the shifted power sums
+        d = s1 / n
+        variance = s2 / n - d ** 2
+        moment3 = s3 / n - 3 * d * s2 / n + 2 * d ** 3
+        moment4 = s4 / n - 4 * d * s3 / n + 6 * d ** 2 * s2 / n - 3 * d ** 4
+        first, second = axis_pairs(len(d))
+        covariance = shifted_products / n - d[first] * d[second]
+
+        # the running values are seeded as intermediates of a one-window batch
+        running = {
+            'mean': self.shift + d, 'variance': variance, 'moment3': moment3, 'moment4': moment4,
+            'covariance': covariance, 'cross_products': cross_products, 'sum_abs': sum_abs,
+            'sum_squares': sum_squares, 'waveform_length': waveform_length, 'wilson_amp': wilson_amp,
+            'sign_changes': sign_changes,
+        }
+        ctx = WindowContext(self.ordered()[None], dtype=self.dtype)
+        ctx.values.update({name: value[None] for name, value in running.items()})
+
+        return run_plan(self.plan, ctx, np.empty((1, len(self.columns)), dtype=self.dtype), self.hook)[0]
+
+    # Push (axes, samples) new samples; returns the (rows, columns) feature rows completed by them
+    def push(self, samples):
+        samples = np.asarray(samples, dtype=self.dtype)
+        rows = []
+
+        while samples.shape[-1]:
+            if self.count < self.window:
+                k = min(samples.shape[-1], self.window - self.count)
+                self.fill(samples[:, :k])
+                # the first row is emitted as soon as the window is full
+                if self.count == self.window:
+                    rows.append(self.row())
+            else:
+                # pieces end on row and resync boundaries and stay shorter than the window
+                k = min(samples.shape[-1], self.hop - self.since_row, self.resync_every - self.since_resync,
+                        self.window - 1)
+                self.slide(samples[:, :k])
+                self.since_row += k
+                if self.since_row == self.hop:
+                    rows.append(self.row())
+                    self.since_row = 0
+            samples = samples[:, k:]
+
+        return np.reshape(rows, (len(rows), len(self.columns)))
+
+
+# Per-axis staging in front of StreamingFeatures for samples that arrive in uneven pieces, e.g. one fetch per axis.
+# Every axis keeps its pending samples in a ring buffer of `capacity`; take() hands out the samples that all axes
+# have, as an (axes, samples) array, and keeps the surplus of the axes that are ahead.
+class AxisBuffers:
+    def __init__(self, axes, capacity, dtype=np.float64):
+        self.capacity = capacity
+        self.buffer = np.empty((axes, capacity), dtype=dtype)
+        self.start = np.zeros(axes, dtype=int)
+        self.count = np.zeros(axes, dtype=int)
+
+    # Free space of an axis
+    def room(self, axis):
+        return self.capacity - int(self.count[axis])
+
+    # Append the samples of one axis; needs len(values) <= room(axis)
+    def add(self, axis, values):
+        k = len(values)
+        if k > self.room(axis):
+            raise ValueError(f"{k} samples do not fit in the {self.room(axis)} free slots of axis {axis}")
+
+        positions = (self.start[axis] + self.count[axis] + np.arange(k)) % self.capacity
+        self.buffer[axis, positions] = values
+        self.count[axis] += k
+
+    # Number of samples every axis has
+    def ready(self):
+        return int(self.count.min())
+
+    # Remove and return the (axes, ready()) samples every axis has, oldest first
+    def take(self):
+        k = self.ready()
+        positions = (self.start[:, None] + np.arange(k)) % self.capacity
+        samples = np.take_along_axis(self.buffer, positions, axis=-1)
+        self.start = (self.start + k) % self.capacity
+        self.count -= k
+
+        return samples
+
+    # Drop the samples of all axes, e.g. those of messages whose processing failed
+    def clear(self):
+        self.count[:] = 0
@@ -6,6 +6,9 @@ from telegram.error import TelegramError
 import ssl
 import nats
 import os
+import signal
+import time
+from AckTracker import AckTracker, consumer_ack_wait
 
 # read env variables needed to connect to NATS, Redis, Telegram
 TOKEN = os.getenv('NATS_TOKEN')
@@ -15,6 +18,9 @@ REDIS_ADDRESS=os.getenv('REDIS_ADDRESS')
 TELEGRAM_KEY=os.getenv('TELEGRAM_KEY')
 TELEGRAM_CHAT=os.getenv('TELEGRAM_CHAT')
 
+# seconds between two reports of the ack counters (also on SIGUSR1)
+ACK_REPORT_INTERVAL = float(os.getenv('ACK_REPORT_INTERVAL', 300))
+
 
 # async communication needed for NATS
 async def main():
@@ -40,6 +46,9 @@ async def main():
 
     # create consumers
     sub_y = await js.pull_subscribe("predictions","RPI-sub-predictions","RPI")
+    tracker = AckTracker("RPI-sub-predictions", await consumer_ack_wait(sub_y))
+    asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, lambda: print(tracker.report()))
+    last_report = time.monotonic()
 
     while True:
         try:
@@ -50,10 +59,18 @@ async def main():
             await asyncio.sleep(2)  
             continue  
 
+        tracker.receive(latest_label)
+        undecodable = []
         try:
             # decode message from NATS
             for message in latest_label:
-                encoded_latest_label = message.data.decode()
+                try:
+                    encoded_latest_label = message.data.decode()
+                except UnicodeDecodeError:
+                    undecodable.append(message)
+                    raise
+            # the label is acked once it has been handled, whichever way the iteration ends
+            tracker.consume(len(latest_label))
             
             print("=======\nEncoded latest prediction")
             print(encoded_latest_label)
@@ -106,6 +123,7 @@ async def main():
                 r.set("first_val", encoded_latest_label)
                 r.set("second_val", first_val)
                 r.set("third_val", second_val)
+                await tracker.ack()
                 continue
             
             print("=======\nMost common strings")
@@ -141,9 +159,20 @@ async def main():
 
                 except TelegramError as e:
                     print(f"Telegram Error: {e}")
+
+            await tracker.ack()
         
         except Exception as e:
             print(f"Exception ocurred: {e}")
+            # the label is not retried: it is terminated if it does not decode, acked otherwise
+            try:
+                await tracker.discard(undecodable)
+            except Exception as err:
+                print(f"Discarding failed: {err!r}")
+
+        if time.monotonic() - last_report >= ACK_REPORT_INTERVAL:
+            print(tracker.report())
+            last_report = time.monotonic()
                 
 
 if __name__ == '__main__':
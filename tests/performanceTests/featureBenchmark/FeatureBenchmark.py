@@ -0,0 +1,170 @@
+import argparse
+import glob
+import importlib.util
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+# Per-feature benchmark of SignalFeatures: replays the windows of the recorded datasets through every feature function
+# and through feats_df, reports mean/p50/p99 time and peak allocation per call, saves the results as JSON and compares
+# them with a baseline run.
+#
+# usage: python FeatureBenchmark.py [--output results.json] [--baseline baseline.json] [--module path/SignalFeatures.py]
+
+REPO = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+DATA = os.path.join(REPO, 'ML-model', 'data', 'processed', '*.csv')
+MODULE = os.path.join(REPO, 'feature-extractor', 'SignalFeatures.py')
+
+# per-feature functions of SignalFeatures, called on a window DataFrame
+FEATURE_FUNCTIONS = ['mpf', 'iqr', 'wilson_amp', 'crossco', 'three_quarters', 'one_quarter', 'corecoef', 'sma',
+                     'slope_change', 'rms', 'stdev', 'mean', 'mad', 'zerocr', 'wf', 'mav', 'p2p', 'median_frequency',
+                     'entropy', 'kurtosis', 'skewness', 'top3', 'autoregyw', 'autoregburg', 'enwatco', 'logdetect',
+                     'energy']
+
+
+def load_module(path, name='SignalFeatures'):
+    # the module imports its siblings (e.g. AutoRegression) from its own directory
+    sys.path.insert(0, os.path.dirname(os.path.abspath(path)))
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# Windows of the recordings, 500 samples as served, laid out like the training set (first window at sample 100, hop 500)
+def load_windows(pattern, length=500, start=100, hop=500, limit=None):
+    windows = []
+    for path in sorted(glob.glob(pattern)):
+        data = pd.read_csv(path)[['x', 'y', 'z']]
+        for i in range(start, len(data) - length + 1, hop):
+            windows.append(data.iloc[i:i + length].reset_index(drop=True))
+
+    return windows[:limit]
+
+
+# Time every call of func over the windows (repeat passes) and its peak allocation on a sample of them
+def measure(func, windows, repeat, alloc_windows):
+    # a function that fails on the data (e.g. log of a zero sample in old copies) is reported, not timed
+    try:
+        for window in windows:
+            func(window)
+    except Exception as err:
+        return {'error': f"{type(err).__name__}: {err}"}
+
+    times = []
+    for _ in range(repeat):
+        for window in windows:
+            start = time.perf_counter_ns()
+            func(window)
+            times.append(time.perf_counter_ns() - start)
+
+    peaks = []
+    tracemalloc.start()
+    for window in windows[:alloc_windows]:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        func(window)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+
+    times = np.array(times) / 1000
+    return {
+        'calls': len(times),
+        'mean_us': float(np.mean(times)),
+        'p50_us': float(np.percentile(times, 50)),
+        'p99_us': float(np.percentile(times, 99)),
+        'peak_kib': float(np.mean(peaks) / 1024),
+    }
+
+
+def run(module, windows, repeat, alloc_windows):
+    results = {}
+    for name in FEATURE_FUNCTIONS:
+        if hasattr(module, name):
+            results[name] = measure(getattr(module, name), windows, repeat, alloc_windows)
+    results['feats_df'] = measure(module.feats_df, windows, repeat, alloc_windows)
+
+    return results
+
+
+# Names whose p50 time or peak allocation grew beyond the thresholds (fractions, 0.2 = 20 % worse) since the baseline;
+# allocation growth below alloc_min_kib is ignored, small allocations are too noisy for a ratio
+def compare(results, baseline, time_threshold, alloc_threshold, alloc_min_kib):
+    regressions = []
+    print(f"{'feature':<18}{'p50 us':>12}{'baseline':>12}{'ratio':>8}{'KiB':>10}{'baseline':>10}")
+    for name, result in results.items():
+        if 'error' in result or 'error' in baseline.get(name, {'error': None}):
+            continue
+        old = baseline[name]
+        ratio = result['p50_us'] / old['p50_us']
+        alloc_growth = result['peak_kib'] - old['peak_kib']
+        alloc_regression = alloc_growth > alloc_min_kib and alloc_growth > alloc_threshold * old['peak_kib']
+        flag = ''
+        if ratio > 1 + time_threshold or alloc_regression:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:<18}{result['p50_us']:>12.1f}{old['p50_us']:>12.1f}{ratio:>8.2f}"
+              f"{result['peak_kib']:>10.1f}{old['peak_kib']:>10.1f}{flag}")
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-feature benchmark of SignalFeatures")
+    parser.add_argument('--module', default=MODULE, help="SignalFeatures.py to benchmark")
+    parser.add_argument('--data', default=DATA, help="glob of the recorded x, y, z csv files")
+    parser.add_argument('--windows', type=int, default=200, help="number of windows to replay")
+    parser.add_argument('--repeat', type=int, default=3, help="passes over the windows")
+    parser.add_argument('--alloc-windows', type=int, default=20, help="windows traced for allocations")
+    parser.add_argument('--output', default='benchmark.json', help="where to store the results")
+    parser.add_argument('--baseline', help="results of an earlier run to compare with")
+    parser.add_argument('--time-threshold', type=float, default=0.2, help="allowed p50 slowdown, 0.2 = 20 %%")
+    parser.add_argument('--alloc-threshold', type=float, default=0.2, help="allowed peak allocation growth")
+    parser.add_argument('--alloc-min-kib', type=float, default=16, help="allocation growth always allowed, in KiB")
+    args = parser.parse_args()
+
+    module = load_module(args.module)
+    windows = load_windows(args.data, limit=args.windows)
+    print(f"Benchmarking {args.module} on {len(windows)} windows x {args.repeat}")
+
+    results = run(module, windows, args.repeat, args.alloc_windows)
+    report = {
+        'meta': {
+            'module': os.path.relpath(args.module, REPO),
+            'windows': len(windows),
+            'repeat': args.repeat,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    if not args.baseline:
+        print(f"{'feature':<18}{'mean us':>12}{'p50 us':>12}{'p99 us':>12}{'KiB':>10}")
+        for name, result in results.items():
+            if 'error' in result:
+                print(f"{name:<18}{result['error']}")
+                continue
+            print(f"{name:<18}{result['mean_us']:>12.1f}{result['p50_us']:>12.1f}{result['p99_us']:>12.1f}"
+                  f"{result['peak_kib']:>10.1f}")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)['results']
+    regressions = compare(results, baseline, args.time_threshold, args.alloc_threshold, args.alloc_min_kib)
+    if regressions:
+        print(f"Regressions: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
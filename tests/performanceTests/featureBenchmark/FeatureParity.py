@@ -0,0 +1,124 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+from FeatureBenchmark import DATA, REPO, load_module, load_windows
+
+# Golden-output parity harness for the SignalFeatures implementations: runs every implementation over the same
+# recorded windows, diffs every feature column against the reference (the training copy the model was fitted on, or a
+# stored golden file) within tolerance, and times the implementations side by side. Exit code 1 on any mismatch.
+#
+# usage: python FeatureParity.py [--windows 100] [--save-golden golden.csv | --golden golden.csv]
+
+COPIES = {
+    'training': os.path.join(REPO, 'ML-model', 'data', 'features', 'SignalFeatures.py'),
+    'dev-tools': os.path.join(REPO, 'dev-tools', 'SignalFeatures.py'),
+    'serving': os.path.join(REPO, 'feature-extractor', 'SignalFeatures.py'),
+}
+REFERENCE = 'training'
+
+
+# Feature rows of every window with an implementation's feats_df
+def run_feats_df(module, windows):
+    return pd.concat([module.feats_df(window) for window in windows], ignore_index=True)
+
+
+# Feature rows of all windows at once with the batched engine of the serving copy
+def run_feats_batch(module, windows):
+    matrix = module.feats_batch(np.stack([window.to_numpy().T for window in windows]))
+    return pd.DataFrame(matrix, columns=module.feature_names(module.AXES, len(windows[0])))
+
+
+# name -> function(windows) returning the feature DataFrame
+def implementations(names):
+    runs = {}
+    for name in names:
+        module = load_module(COPIES[name], f"SignalFeatures_{name.replace('-', '_')}")
+        runs[name] = lambda windows, module=module: run_feats_df(module, windows)
+        if hasattr(module, 'feats_batch'):
+            runs[f"{name}/batch"] = lambda windows, module=module: run_feats_batch(module, windows)
+
+    return runs
+
+
+# Per-column maximum absolute and relative difference, and the columns outside tolerance
+def diff_columns(result, reference, rtol, atol):
+    mismatches = {}
+    worst = {}
+    for column in reference.columns:
+        expected = reference[column].to_numpy(dtype=np.float64)
+        actual = result[column].to_numpy(dtype=np.float64)
+        close = np.isclose(actual, expected, rtol=rtol, atol=atol, equal_nan=True)
+
+        difference = np.abs(actual - expected)
+        difference[np.isnan(expected) & np.isnan(actual)] = 0
+        relative = difference / np.maximum(np.abs(expected), atol)
+        worst[column] = (np.nanmax(difference), np.nanmax(relative))
+        if not close.all():
+            mismatches[column] = int(np.sum(~close))
+
+    return worst, mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parity and timing of the SignalFeatures implementations")
+    parser.add_argument('--data', default=DATA, help="glob of the recorded x, y, z csv files")
+    parser.add_argument('--windows', type=int, default=100, help="number of windows to replay")
+    parser.add_argument('--length', type=int, default=501, help="window length (501 in the training set)")
+    parser.add_argument('--copies', nargs='+', default=list(COPIES), choices=list(COPIES))
+    parser.add_argument('--rtol', type=float, default=1e-6)
+    parser.add_argument('--atol', type=float, default=1e-9)
+    parser.add_argument('--golden', help="stored reference features to compare with instead of the training copy")
+    parser.add_argument('--save-golden', help="store the reference features of these windows")
+    args = parser.parse_args()
+
+    windows = load_windows(args.data, length=args.length, limit=args.windows)
+    print(f"Parity on {len(windows)} windows of {args.length} samples")
+
+    timings = {}
+    results = {}
+    for name, run in implementations(args.copies).items():
+        start = time.perf_counter()
+        results[name] = run(windows)
+        timings[name] = time.perf_counter() - start
+
+    if args.golden:
+        reference = pd.read_csv(args.golden)
+        reference_name = args.golden
+    else:
+        reference = results[REFERENCE]
+        reference_name = REFERENCE
+    if args.save_golden:
+        reference.to_csv(args.save_golden, index=False)
+
+    failed = False
+    base_time = timings.get(REFERENCE)
+    print(f"\n{'implementation':<20}{'total s':>10}{'ms/window':>12}{'speedup':>10}{'max rel diff':>15}  status")
+    for name, result in results.items():
+        missing = [c for c in reference.columns if c not in result.columns]
+        extra = [c for c in result.columns if c not in reference.columns]
+        if len(result) != len(reference) or missing:
+            status = f"FAIL: {len(result)} rows, missing columns {missing}"
+            worst, mismatches = {}, {}
+        else:
+            worst, mismatches = diff_columns(result, reference, args.rtol, args.atol)
+            status = f"FAIL: {len(mismatches)} columns differ" if mismatches else "ok"
+        if extra:
+            status += f" (extra columns {extra})"
+        failed |= status.startswith('FAIL')
+
+        speedup = f"{base_time / timings[name]:.1f}x" if base_time else '-'
+        max_rel = max((rel for _, rel in worst.values()), default=float('nan'))
+        print(f"{name:<20}{timings[name]:>10.2f}{timings[name] / len(windows) * 1000:>12.2f}{speedup:>10}"
+              f"{max_rel:>15.2e}  {status}")
+        for column, count in mismatches.items():
+            print(f"    {column}: {count} windows, max abs diff {worst[column][0]:.3e}, rel {worst[column][1]:.3e}")
+
+    print(f"\nReference: {reference_name}, tolerance rtol={args.rtol} atol={args.atol}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())